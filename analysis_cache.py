@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import time
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+CACHE_DIR = 'cache_analisis'
+# Se incrementa cuando cambia el formato del resumen o algo que altera los conteos sin aparecer en la clave
+CACHE_VERSION = 2
+# Campos del resultado que se guardan; métricas y tiempos pertenecen a cada ejecución
+CACHED_FIELDS = ('total_frames', 'detections', 'total_detections', 'cars_detected', 'line_counts', 'start_time',
+                 'time_source')
+# Hashes de los videos subidos, junto a la carpeta de subidas como las subidas parciales
+HASHES_FOLDER = '.hashes'
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_stream(stream, path, chunk_size=HASH_CHUNK_SIZE):
+    # El hash se calcula mientras se escribe, sin volver a leer el archivo
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def _hash_record_path(path):
+    return os.path.join(os.path.dirname(path), HASHES_FOLDER, os.path.basename(path) + '.json')
+
+
+def remember_hash(path, content_hash):
+    stat = os.stat(path)
+    record_path = _hash_record_path(path)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    with open(record_path, 'w', encoding='utf-8') as f:
+        json.dump({'sha256': content_hash, 'size': stat.st_size, 'mtime': stat.st_mtime}, f)
+
+
+def content_hash(path):
+    # Hash guardado al subir; si el archivo cambió desde entonces (o se copió a mano) se recalcula
+    stat = os.stat(path)
+    try:
+        with open(_hash_record_path(path), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        if record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+            return record['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+    digest = hash_file(path)
+    remember_hash(path, digest)
+    return digest
+
+
+class AnalysisCache:
+    # Resúmenes de análisis en disco, uno por archivo JSON, indexados por contenido del video y parámetros
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def key(self, content_hash, params):
+        payload = json.dumps({'version': CACHE_VERSION, 'sha256': content_hash, 'params': params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)['result']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, result, content_hash=None, params=None):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {
+            'sha256': content_hash,
+            'params': params,
+            'created_at': time.time(),
+            'result': {field: result.get(field) for field in CACHED_FIELDS}
+        }
+        # Escritura atómica: un lector concurrente ve la entrada completa o ninguna
+        temporary = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, default=str)
+        os.replace(temporary, self._path(key))
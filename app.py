@@ -1,20 +1,123 @@
 from flask import Flask, render_template, request, jsonify, send_from_directory
-import cv2
-from ultralytics import YOLO
 import os
-import csv
-from datetime import datetime
-import pandas as pd
+import time
 from werkzeug.utils import secure_filename
-from scipy.spatial import distance
 import json
+from datetime import datetime
+import threading
+from video_analysis import TRACKER_MAX_DISAPPEARED, TRACKER_MAX_DISTANCE, analyze_video as analyze_video_file
+from jobs import JOB_DONE, JOB_ERROR, JobManager
+from detection_store import TABLE_CARS, TABLE_DETECTIONS, TIMESTAMP_FORMAT, open_store, save_detections
+from response_cache import ResponseCache
+from chunked_upload import UploadError, UploadSessions
+from analysis_cache import AnalysisCache, content_hash, remember_hash, save_stream
+from capture_time import parse_start_time
+from metrics import MetricsRegistry, metric_key
+from spatial import SpatialIndex, parse_bbox, precision_for_zoom
+from timeseries import BUCKETS, DEFAULT_BUCKET, bucket_range, build_series, parse_group_by, parse_time_range
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, warmup_models
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024
+app.config['YOLO_MODEL'] = DEFAULT_MODEL
+app.config['YOLO_MODELS'] = {'yolov8n.pt', 'yolov8s.pt'}
+# 'pytorch', 'onnx', 'openvino' u 'openvino-int8'; en nodos sin GPU conviene ONNX Runtime u OpenVINO.
+# Los modelos convertidos se exportan una vez y se guardan en modelos_exportados/
+app.config['INFERENCE_BACKEND'] = DEFAULT_INFERENCE_BACKEND
+app.config['CONFIDENCE_THRESHOLD'] = 0.5
+app.config['INFERENCE_BATCH_SIZE'] = 4
+app.config['ANALYSIS_WORKERS'] = 2
+app.config['FRAME_STRIDE'] = 1
+app.config['MOTION_THRESHOLD'] = None
+# Opciones de open_video: decoder 'opencv' o 'ffmpeg', width (escalado en el decodificador), threads,
+# frame_step (frames omitidos por el decodificador) y hwaccel
+app.config['DECODE_OPTIONS'] = {'decoder': 'opencv'}
+# Procesos por análisis para dividir un video largo en segmentos
+app.config['SEGMENT_WORKERS'] = max(1, (os.cpu_count() or 1) // app.config['ANALYSIS_WORKERS'])
+app.config['DETECTION_STORE'] = {'backend': 'sqlite', 'path': 'detecciones.db'}
+# Guardado por lotes durante el análisis con checkpoints para reanudar; None guarda todo al final
+app.config['STREAMING_PERSISTENCE'] = {'fsync': 'checkpoint', 'flush_rows': 5000, 'checkpoint_frames': 1800,
+                                       'checkpoint_dir': 'checkpoints'}
+# Resúmenes de videos ya analizados, por hash del contenido y parámetros del análisis
+app.config['ANALYSIS_CACHE_DIR'] = 'cache_analisis'
+app.config['LOG_JOB_METRICS'] = False
+# ROI y líneas de conteo por cámara: {"camara": {"roi": [[x, y], ...], "lines": [{"name", "points"}]}}
+app.config['CAMERAS_FILE'] = 'camaras.json'
+
+metrics = MetricsRegistry()
+
+def record_job_metrics(job):
+    result = job['result'] if isinstance(job['result'], dict) else {}
+    # Las métricas del worker se acumulan aquí y no se devuelven al cliente
+    metrics.merge(result.pop('metrics', None))
+    metrics.inc('jobs_total', status=job['status'])
+    
+    if app.config['LOG_JOB_METRICS']:
+        app.logger.info('Trabajo %s (%s) en %.1fs: %s', job['job_id'], job['status'],
+                        job['finished_at'] - job['submitted_at'], json.dumps(result.get('stage_stats')))
+
+def release_pending_analysis(job):
+    # Terminado el trabajo, un nuevo envío del mismo video se resuelve desde la caché o se vuelve a encolar
+    with _pending_lock:
+        for cache_key, job_id in list(_pending_analyses.items()):
+            if job_id == job['job_id']:
+                del _pending_analyses[cache_key]
+
+def on_job_finished(job):
+    record_job_metrics(job)
+    release_pending_analysis(job)
+
+job_manager = JobManager(max_workers=app.config['ANALYSIS_WORKERS'],
+                         initializer=warmup_models,
+                         initargs=([app.config['YOLO_MODEL']], app.config['INFERENCE_BACKEND']),
+                         on_finish=on_job_finished)
+
+response_cache = ResponseCache()
+upload_sessions = UploadSessions(app.config['UPLOAD_FOLDER'], max_size=app.config['MAX_CONTENT_LENGTH'])
+analysis_cache = AnalysisCache(app.config['ANALYSIS_CACHE_DIR'])
+
+# Trabajo en curso por clave de caché: un mismo video enviado dos veces seguidas se analiza una sola vez
+_pending_analyses = {}
+_pending_lock = threading.RLock()
 
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = open_store(**app.config['DETECTION_STORE'])
+    return _store
+
+def data_version():
+    return get_store().version()
+
+_spatial_index = (None, None)
+
+def get_spatial_index():
+    # Celdas de todas las resoluciones agrupadas una vez por versión de los datos
+    global _spatial_index
+    version = data_version()
+    if _spatial_index[0] != version:
+        _spatial_index = (version, SpatialIndex(get_store().read_rollup(TABLE_CARS)))
+    return _spatial_index[1]
+
+def load_camera_regions():
+    if not os.path.exists(app.config['CAMERAS_FILE']):
+        return {}
+    with open(app.config['CAMERAS_FILE'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def resolve_regions(camera=None, regions=None):
+    if regions:
+        return json.loads(regions) if isinstance(regions, str) else regions
+    return load_camera_regions().get(camera) if camera else None
+
+def unknown_camera(camera):
+    return bool(camera) and camera not in load_camera_regions()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -36,7 +139,8 @@ def upload_video():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        remember_hash(filepath, save_stream(file.stream, filepath))
         
         location = json.loads(location_data) if location_data else None
         
@@ -52,231 +156,303 @@ def upload_video():
 def analyze_video(filename):
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     location = request.args.get('location')
+    model_name = request.args.get('model', app.config['YOLO_MODEL'])
     
     if not os.path.exists(filepath):
         return jsonify({'error': 'Video no encontrado'}), 404
     
-    location_data = json.loads(location) if location else None
-    results = process_video_yolo(filepath, location=location_data)
-    return jsonify(results)
-
-def process_video_yolo(video_path, confidence_threshold=0.5, location=None):
-    model = YOLO('yolov8n.pt')
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
-        return {'error': 'No se pudo abrir el video'}
-    
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    frame_count = 0
-    detections_summary = {}
-    all_detections = []
-    tracked_objects = {}
-    next_object_id = 1
-    max_distance_threshold = 100
-    max_frames_disappeared = 30
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_count += 1
-        results = model(frame, conf=confidence_threshold, verbose=False)
-        
-        current_frame_detections = []
-        
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = box.conf[0].cpu().numpy()
-                    class_id = int(box.cls[0].cpu().numpy())
-                    class_name = model.names[class_id]
-                    
-                    bbox_width = x2 - x1
-                    bbox_height = y2 - y1
-                    bbox_center_x = x1 + bbox_width / 2
-                    bbox_center_y = y1 + bbox_height / 2
-                    
-                    current_frame_detections.append({
-                        'center': (bbox_center_x, bbox_center_y),
-                        'class': class_name,
-                        'confidence': confidence,
-                        'bbox': (x1, y1, x2, y2),
-                        'width': bbox_width,
-                        'height': bbox_height
-                    })
-        
-        for obj_id in list(tracked_objects.keys()):
-            tracked_objects[obj_id]['frames_disappeared'] += 1
-            if tracked_objects[obj_id]['frames_disappeared'] > max_frames_disappeared:
-                del tracked_objects[obj_id]
-        
-        for detection in current_frame_detections:
-            matched_id = None
-            min_distance = float('inf')
-            
-            for obj_id, tracked_obj in tracked_objects.items():
-                if tracked_obj['class'] == detection['class']:
-                    dist = distance.euclidean(detection['center'], tracked_obj['last_center'])
-                    if dist < min_distance and dist < max_distance_threshold:
-                        min_distance = dist
-                        matched_id = obj_id
-            
-            if matched_id is not None:
-                tracked_objects[matched_id]['last_center'] = detection['center']
-                tracked_objects[matched_id]['frames_disappeared'] = 0
-                tracked_objects[matched_id]['last_frame'] = frame_count
-            else:
-                object_id = next_object_id
-                tracked_objects[object_id] = {
-                    'class': detection['class'],
-                    'last_center': detection['center'],
-                    'frames_disappeared': 0,
-                    'first_frame': frame_count,
-                    'last_frame': frame_count
-                }
-                next_object_id += 1
-                
-                if detection['class'] not in detections_summary:
-                    detections_summary[detection['class']] = 0
-                detections_summary[detection['class']] += 1
-                
-                time_seconds = frame_count / fps
-                x1, y1, x2, y2 = detection['bbox']
-                
-                detection_data = {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'frame_number': frame_count,
-                    'time_seconds': round(time_seconds, 2),
-                    'object_class': detection['class'],
-                    'confidence': round(float(detection['confidence']), 3),
-                    'bbox_x1': round(float(x1), 1),
-                    'bbox_y1': round(float(y1), 1),
-                    'bbox_x2': round(float(x2), 1),
-                    'bbox_y2': round(float(y2), 1),
-                    'bbox_width': round(float(detection['width']), 1),
-                    'bbox_height': round(float(detection['height']), 1),
-                    'bbox_center_x': round(float(detection['center'][0]), 1),
-                    'bbox_center_y': round(float(detection['center'][1]), 1)
-                }
-                all_detections.append(detection_data)
-    
-    cap.release()
-    
-    csv_filename = 'detecciones_completas.csv'
-    save_to_csv(all_detections, csv_filename, location)
-    
-    cars_only = [d for d in all_detections if d['object_class'] == 'car']
-    if cars_only:
-        save_to_csv(cars_only, 'autos_solo.csv', location)
+    if model_name not in app.config['YOLO_MODELS']:
+        return jsonify({'error': 'Modelo no disponible'}), 400
     
+    if unknown_camera(request.args.get('camera')):
+        return jsonify({'error': 'Cámara no configurada'}), 404
+    
+    try:
+        start_time = parse_start_time(request.args.get('start_time'))
+    except ValueError:
+        return jsonify({'error': 'start_time debe tener formato AAAA-MM-DD HH:MM:SS'}), 400
+    
+    location_data = json.loads(location) if location else None
+    regions = resolve_regions(request.args.get('camera'), request.args.get('regions'))
+    analysis = submit_analysis(filepath, location_data, model_name, regions, start_time=start_time)
+    return jsonify(analysis), 200 if analysis['cached'] else 202
+
+def analysis_params(model_name, regions=None, start_time=None):
+    # Todo lo que cambia el resultado de un mismo video; el lote y los procesos no lo alteran
     return {
+        'model': model_name,
+        'inference_backend': app.config['INFERENCE_BACKEND'],
+        'confidence_threshold': app.config['CONFIDENCE_THRESHOLD'],
+        'tracker': {'max_distance': TRACKER_MAX_DISTANCE, 'max_disappeared': TRACKER_MAX_DISAPPEARED},
+        'frame_stride': app.config['FRAME_STRIDE'],
+        'motion_threshold': app.config['MOTION_THRESHOLD'],
+        'decode_options': app.config['DECODE_OPTIONS'],
+        'regions': regions,
+        # Las marcas de tiempo guardadas dependen del inicio indicado
+        'start_time': start_time
+    }
+
+def submit_analysis(filepath, location=None, model_name=None, regions=None, sha256=None, start_time=None):
+    # Un video ya analizado con los mismos parámetros devuelve el resumen guardado sin volver a insertar
+    # sus detecciones
+    model_name = model_name or app.config['YOLO_MODEL']
+    params = analysis_params(model_name, regions, start_time)
+    sha256 = sha256 or content_hash(filepath)
+    cache_key = analysis_cache.key(sha256, params)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        metrics.inc('analysis_cache_requests_total', result='hit')
+        return {'success': True, 'cached': True, 'sha256': sha256, 'result': dict(cached, success=True, cached=True)}
+    
+    with _pending_lock:
+        job_id = _pending_analyses.get(cache_key)
+        job = job_manager.status(job_id) if job_id else None
+        if job is None or job['finished_at'] is not None:
+            metrics.inc('analysis_cache_requests_total', result='miss')
+            job_id = job_manager.submit(process_video_yolo, filepath, location=location, model_name=model_name,
+                                        regions=regions, confidence_threshold=app.config['CONFIDENCE_THRESHOLD'],
+                                        batch_size=app.config['INFERENCE_BATCH_SIZE'],
+                                        frame_stride=app.config['FRAME_STRIDE'],
+                                        motion_threshold=app.config['MOTION_THRESHOLD'],
+                                        decode_options=app.config['DECODE_OPTIONS'],
+                                        inference_backend=app.config['INFERENCE_BACKEND'],
+                                        streaming=app.config['STREAMING_PERSISTENCE'],
+                                        workers=app.config['SEGMENT_WORKERS'], start_time=start_time,
+                                        cache_key=cache_key, sha256=sha256, cache_params=params)
+            _pending_analyses[cache_key] = job_id
+    return {'success': True, 'cached': False, 'sha256': sha256, 'job_id': job_id}
+
+@app.errorhandler(UploadError)
+def handle_upload_error(error):
+    return jsonify({'error': error.message, 'offset': error.offset}), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    payload = request.get_json(silent=True) or {}
+    filename = payload.get('filename', '')
+    
+    if not allowed_file(filename):
+        return jsonify({'error': 'Formato no válido'}), 400
+    
+    if unknown_camera(payload.get('camera')):
+        return jsonify({'error': 'Cámara no configurada'}), 404
+    
+    try:
+        start_time = parse_start_time(payload.get('start_time'))
+    except ValueError:
+        return jsonify({'error': 'start_time debe tener formato AAAA-MM-DD HH:MM:SS'}), 400
+    
+    regions = resolve_regions(payload.get('camera'), payload.get('regions'))
+    upload_id = upload_sessions.create(filename, payload.get('size'), payload.get('location'), regions, start_time)
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': 0}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    info = upload_sessions.info(upload_id)
+    return jsonify({'upload_id': upload_id, 'offset': info['offset'], 'size': info['total_size']})
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def append_upload(upload_id):
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Falta la cabecera Upload-Offset'}), 400
+    
+    # El cuerpo se escribe a disco por bloques a medida que llega
+    new_offset = upload_sessions.append(upload_id, offset, request.stream)
+    return jsonify({'success': True, 'offset': new_offset})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    model_name = request.args.get('model', app.config['YOLO_MODEL'])
+    if model_name not in app.config['YOLO_MODELS']:
+        return jsonify({'error': 'Modelo no disponible'}), 400
+    
+    info = upload_sessions.complete(upload_id)
+    analysis = submit_analysis(info['filepath'], info['location'], model_name, info.get('regions'), info['sha256'],
+                               info.get('start_time'))
+    return jsonify(dict(analysis, filename=info['filename'], location=info['location'])), \
+        200 if analysis['cached'] else 202
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'frames_processed': job['frames_processed'],
+        'total_frames': job['total_frames'],
+        'progress': job['progress'],
+        'error': job['error']
+    })
+
+@app.route('/api/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    if job['status'] == JOB_ERROR:
+        return jsonify({'error': job['error']}), 500
+    if job['status'] != JOB_DONE:
+        return jsonify({'error': 'El análisis aún no ha terminado', 'status': job['status']}), 409
+    
+    return jsonify(job['result'])
+
+def process_video_yolo(video_path, confidence_threshold=0.5, location=None, model_name=DEFAULT_MODEL,
+                       batch_size=1, frame_stride=1, motion_threshold=None, workers=1, regions=None,
+                       decode_options=None, inference_backend=DEFAULT_INFERENCE_BACKEND, streaming=None,
+                       start_time=None, cache_key=None, sha256=None, cache_params=None, progress_callback=None):
+    persist = dict(streaming, store=app.config['DETECTION_STORE'], location=location) if streaming else None
+    analysis = analyze_video_file(video_path, workers=workers, confidence_threshold=confidence_threshold,
+                                  model_name=model_name, batch_size=batch_size, frame_stride=frame_stride,
+                                  motion_threshold=motion_threshold, regions=regions,
+                                  decode_options=decode_options, inference_backend=inference_backend,
+                                  persist=persist, start_time=start_time, progress_callback=progress_callback)
+    
+    if 'error' in analysis:
+        return analysis
+    
+    job_metrics = MetricsRegistry()
+    job_metrics.merge(analysis['metrics'])
+    if analysis['detections']:
+        start = time.perf_counter()
+        save_detections(get_store(), analysis['detections'], location)
+        job_metrics.observe('persist_seconds', time.perf_counter() - start)
+    
+    result = {
         'success': True,
-        'total_frames': total_frames,
-        'detections': detections_summary,
-        'total_detections': len(all_detections),
-        'cars_detected': len(cars_only)
+        'total_frames': analysis['total_frames'],
+        'detections': analysis['summary'],
+        'total_detections': sum(analysis['summary'].values()),
+        'cars_detected': analysis['summary'].get('car', 0),
+        'line_counts': analysis['line_counts'],
+        'start_time': datetime.fromtimestamp(analysis['start_time']).strftime(TIMESTAMP_FORMAT),
+        'time_source': analysis['time_source'],
+        'stage_stats': analysis['stage_stats'],
+        'metrics': job_metrics.snapshot()
     }
+    if cache_key is not None:
+        analysis_cache.put(cache_key, result, sha256, cache_params)
+    return result
 
-def save_to_csv(detections_data, csv_filename, location=None):
-    fieldnames = [
-        'timestamp', 'frame_number', 'time_seconds', 'object_class', 'confidence',
-        'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2',
-        'bbox_width', 'bbox_height', 'bbox_center_x', 'bbox_center_y',
-        'location_lat', 'location_lng'
-    ]
-    
-    file_exists = os.path.exists(csv_filename)
-    
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists or os.path.getsize(csv_filename) == 0:
-            writer.writeheader()
-        for detection in detections_data:
-            if location:
-                detection['location_lat'] = location['lat']
-                detection['location_lng'] = location['lng']
-            writer.writerow(detection)
+@app.route('/metrics')
+def get_metrics():
+    extra = job_manager.running_gauges()
+    extra[metric_key('jobs_in_flight')] = job_manager.jobs_in_flight()
+    extra[metric_key('stats_cache_requests_total', result='hit')] = response_cache.hits
+    extra[metric_key('stats_cache_requests_total', result='miss')] = response_cache.misses
+    return app.response_class(metrics.render(extra), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/stats')
+@response_cache.cached(data_version)
 def get_stats():
     day_filter = request.args.get('day')
     
-    if not os.path.exists('autos_solo.csv'):
+    store = get_store()
+    if store.count(TABLE_CARS) == 0:
         return jsonify({'error': 'No hay datos disponibles'}), 404
     
-    df = pd.read_csv('autos_solo.csv')
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['day_of_week'] = df['timestamp'].dt.dayofweek
-    df['day_name'] = df['timestamp'].dt.day_name()
-    df['hour'] = df['timestamp'].dt.hour
+    rollup = store.read_rollup(TABLE_CARS)
+    rollup['day_of_week'] = rollup['date'].dt.dayofweek
+    rollup['day_name'] = rollup['date'].dt.day_name()
     
     if day_filter and day_filter != 'all':
-        df = df[df['day_of_week'] == int(day_filter)]
+        rollup = rollup[rollup['day_of_week'] == int(day_filter)]
     
     days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    day_counts = df.groupby('day_name').size().reindex(days_order, fill_value=0).to_dict()
-    
-    hour_counts = df.groupby('hour').size().to_dict()
-    
-    confidence_avg = df['confidence'].mean()
-    
-    heatmap_features = []
-    if 'location_lat' in df.columns and 'location_lng' in df.columns:
-        location_groups = df.groupby(['location_lat', 'location_lng']).size().reset_index(name='count')
-        for _, row in location_groups.iterrows():
-            if pd.notna(row['location_lat']) and pd.notna(row['location_lng']):
-                heatmap_features.append({
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'Point',
-                        'coordinates': [row['location_lng'], row['location_lat']]
-                    },
-                    'properties': {
-                        'intensity': int(row['count'])
-                    }
-                })
+    day_counts = rollup.groupby('day_name')['count'].sum().reindex(days_order, fill_value=0).to_dict()
+    
+    hour_counts = rollup.groupby('hour')['count'].sum().to_dict()
     
+    total_cars = int(rollup['count'].sum())
+    confidence_avg = rollup['confidence_sum'].sum() / total_cars if total_cars else 0.0
+    
+    # El mapa de calor se pide aparte a /api/stats/heatmap, solo con las celdas visibles
     return jsonify({
         'by_day': day_counts,
         'by_hour': hour_counts,
-        'total_cars': len(df),
+        'total_cars': total_cars,
         'avg_confidence': round(confidence_avg, 3),
-        'heatmap_data': heatmap_features,
-        'filtered_count': len(df)
+        'filtered_count': total_cars
+    })
+
+@app.route('/api/stats/heatmap')
+@response_cache.cached(data_version)
+def get_heatmap():
+    # Solo las celdas visibles en el mapa, con el tamaño de celda que corresponde al zoom
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = request.args.get('zoom', type=float)
+    except ValueError:
+        return jsonify({'error': 'bbox debe ser "min_lng,min_lat,max_lng,max_lat"'}), 400
+    day_filter = request.args.get('day')
+    day_of_week = int(day_filter) if day_filter and day_filter != 'all' else None
+    
+    if get_store().count(TABLE_CARS) == 0:
+        return jsonify({'type': 'FeatureCollection', 'features': [], 'precision': precision_for_zoom(zoom)})
+    
+    features = get_spatial_index().features(bbox, zoom, day_of_week)
+    return jsonify({'type': 'FeatureCollection', 'features': features, 'precision': precision_for_zoom(zoom)})
+
+@app.route('/api/timeseries')
+@response_cache.cached(data_version)
+def get_timeseries():
+    # ?start=2024-01-01&end=2024-03-31&bucket=15m&group_by=object_class,location&classes=car,truck&bbox=...
+    bucket = request.args.get('bucket', DEFAULT_BUCKET)
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"bucket debe ser uno de: {', '.join(BUCKETS)}"}), 400
+    try:
+        start, end = parse_time_range(request.args.get('start'), request.args.get('end'))
+        group_by = parse_group_by(request.args.get('group_by'))
+        bbox = parse_bbox(request.args.get('bbox'))
+        bucket_range(start, end, BUCKETS[bucket])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    classes = [name for name in request.args.get('classes', '').split(',') if name] or None
+    
+    buckets = get_store().time_buckets(TABLE_DETECTIONS, start, end, BUCKETS[bucket], group_by, classes, bbox)
+    return jsonify({
+        'start': start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end': end.strftime('%Y-%m-%dT%H:%M:%S'),
+        'bucket': bucket,
+        'group_by': group_by,
+        'series': build_series(buckets, start, end, BUCKETS[bucket], group_by)
     })
 
 @app.route('/api/stats/filter')
+@response_cache.cached(data_version)
 def get_filtered_stats():
     start_date = request.args.get('start')
     end_date = request.args.get('end')
     
-    if not os.path.exists('autos_solo.csv'):
+    store = get_store()
+    if store.count(TABLE_CARS) == 0:
         return jsonify({'error': 'No hay datos disponibles'}), 404
     
-    df = pd.read_csv('autos_solo.csv')
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    rollup = store.read_rollup(TABLE_CARS)
+    rollup['day_name'] = rollup['date'].dt.day_name()
     
     if start_date:
-        df = df[df['timestamp'] >= start_date]
+        rollup = rollup[rollup['date'] >= start_date]
     if end_date:
-        df = df[df['timestamp'] <= end_date]
-    
-    df['day_name'] = df['timestamp'].dt.day_name()
+        rollup = rollup[rollup['date'] <= end_date]
     
     days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    day_counts = df.groupby('day_name').size().reindex(days_order, fill_value=0).to_dict()
+    day_counts = rollup.groupby('day_name')['count'].sum().reindex(days_order, fill_value=0).to_dict()
     
     return jsonify({
         'by_day': day_counts,
-        'total_cars': len(df)
+        'total_cars': int(rollup['count'].sum())
     })
 
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    debug = True
+    # Con el recargador este bloque corre también en el proceso que solo vigila los archivos;
+    # los workers se crean únicamente en el proceso que atiende las peticiones
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_manager.start()
+    app.run(debug=debug, host='0.0.0.0', port=5000)
@@ -0,0 +1,226 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from analysis_cache import hash_file
+from detection_store import (DEFAULT_BACKEND, STORE_BACKENDS, TABLE_CARS, TABLE_DETECTIONS,
+                             detections_to_frame, open_store)
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, INFERENCE_BACKENDS, warmup_models
+from video_analysis import analyze_video
+from video_io import add_decode_arguments, decode_options_from_args
+
+VIDEO_EXTENSIONS = ('mp4', 'avi', 'mov', 'mkv')
+DEFAULT_LEDGER = 'videos_procesados.jsonl'
+# Filas acumuladas antes de escribir al almacén en una sola operación
+BULK_WRITE_ROWS = 50000
+
+
+def parse_location(value):
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return {'lat': float(value['lat']), 'lng': float(value['lng'])}
+    lat, lng = str(value).split(',')
+    return {'lat': float(lat), 'lng': float(lng)}
+
+
+def load_regions(value, base_dir='.'):
+    if not value or isinstance(value, dict):
+        return value or None
+    with open(os.path.join(base_dir, value), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_manifest(manifest_path):
+    # JSON: lista de {"path", "location": {"lat", "lng"}, "regions", "start_time"}; CSV: columnas path, lat, lng,
+    # regions, start_time donde regions es el ROI y las líneas de conteo de la cámara (o la ruta a un JSON con
+    # ellos) y start_time el inicio de la grabación cuando no está en los metadatos ni en el nombre del archivo
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.endswith('.csv'):
+        with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+            entries = [{'path': row['path'],
+                        'location': {'lat': row['lat'], 'lng': row['lng']} if row.get('lat') else None,
+                        'regions': row.get('regions') or None,
+                        'start_time': row.get('start_time') or None}
+                       for row in csv.DictReader(f)]
+    else:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+
+    return [{'path': os.path.join(base_dir, entry['path']), 'location': parse_location(entry.get('location')),
+             'regions': load_regions(entry.get('regions'), base_dir), 'start_time': entry.get('start_time')}
+            for entry in entries]
+
+
+def find_videos(source, location=None, regions=None):
+    if os.path.isdir(source):
+        paths = [path for extension in VIDEO_EXTENSIONS
+                 for path in glob.glob(os.path.join(source, '**', f'*.{extension}'), recursive=True)]
+        return [{'path': path, 'location': location, 'regions': regions, 'start_time': None}
+                for path in sorted(paths)]
+    entries = read_manifest(source)
+    for entry in entries:
+        entry['location'] = entry['location'] or location
+        entry['regions'] = entry['regions'] or regions
+    return entries
+
+
+class ProcessedLedger:
+    def __init__(self, path=DEFAULT_LEDGER):
+        self.path = path
+        self.hashes = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.hashes = {json.loads(line)['sha256'] for line in f if line.strip()}
+
+    def __contains__(self, content_hash):
+        return content_hash in self.hashes
+
+    def record(self, entries):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+                self.hashes.add(entry['sha256'])
+
+
+def _analyze_file(path, options):
+    started = time.perf_counter()
+    analysis = analyze_video(path, **options)
+    analysis.pop('metrics', None)
+    analysis['seconds'] = time.perf_counter() - started
+    return analysis
+
+
+class BulkWriter:
+    def __init__(self, store, ledger, bulk_rows=BULK_WRITE_ROWS):
+        self.store = store
+        self.ledger = ledger
+        self.bulk_rows = bulk_rows
+        self._frames = []
+        self._entries = []
+        self._rows = 0
+
+    def add(self, detections, location, ledger_entry):
+        if detections:
+            self._frames.append(detections_to_frame(detections, location))
+            self._rows += len(detections)
+        self._entries.append(ledger_entry)
+        if self._rows >= self.bulk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._frames:
+            df = pd.concat(self._frames, ignore_index=True)
+            self.store.append_frame(TABLE_DETECTIONS, df)
+            self.store.append_frame(TABLE_CARS, df[df['object_class'] == 'car'].reset_index(drop=True))
+            print(f"  ✓ {len(df)} detecciones escritas al almacén")
+        # Los archivos se marcan como procesados solo cuando sus detecciones ya están guardadas
+        if self._entries:
+            self.ledger.record(self._entries)
+        self._frames, self._entries, self._rows = [], [], 0
+
+
+def run_batch(videos, store, ledger, workers=2, force=False, **options):
+    pending = []
+    seen = set()
+    for video in videos:
+        content_hash = hash_file(video['path'])
+        if not force and (content_hash in ledger or content_hash in seen):
+            print(f"Omitido (ya procesado): {video['path']}")
+            continue
+        seen.add(content_hash)
+        pending.append(dict(video, sha256=content_hash, size=os.path.getsize(video['path'])))
+
+    if not pending:
+        print("No hay videos nuevos para procesar")
+        return {'processed': 0, 'failed': 0, 'skipped': len(videos)}
+
+    # Los más grandes primero para que el último archivo no deje al resto de los workers ociosos
+    pending.sort(key=lambda video: video['size'], reverse=True)
+    print(f"Procesando {len(pending)} videos con {workers} workers ({len(videos) - len(pending)} omitidos)")
+
+    writer = BulkWriter(store, ledger)
+    processed = failed = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warmup_models,
+                             initargs=([options.get('model_name', DEFAULT_MODEL)],
+                                       options.get('inference_backend', DEFAULT_INFERENCE_BACKEND))) as executor:
+        futures = {executor.submit(_analyze_file, video['path'],
+                                   dict(options, regions=video['regions'], start_time=video['start_time'])): video
+                   for video in pending}
+        for future in as_completed(futures):
+            video = futures[future]
+            done = processed + failed + 1
+            try:
+                analysis = future.result()
+                if 'error' in analysis:
+                    raise RuntimeError(analysis['error'])
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(pending)}] ✗ {video['path']}: {e}")
+                continue
+
+            processed += 1
+            cars = analysis['summary'].get('car', 0)
+            print(f"[{done}/{len(pending)}] ✓ {video['path']}: {analysis['frames']} frames, "
+                  f"{len(analysis['detections'])} detecciones, {cars} autos en {analysis['seconds']:.1f}s")
+            writer.add(analysis['detections'], video['location'], {
+                'sha256': video['sha256'],
+                'path': video['path'],
+                'location': video['location'],
+                'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'frames': analysis['frames'],
+                'start_time': datetime.fromtimestamp(analysis['start_time']).strftime('%Y-%m-%d %H:%M:%S'),
+                'time_source': analysis['time_source'],
+                'detections': len(analysis['detections']),
+                'cars': cars,
+                'line_counts': analysis['line_counts']
+            })
+    writer.flush()
+
+    return {'processed': processed, 'failed': failed, 'skipped': len(videos) - len(pending)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Procesa en lote un directorio o manifiesto de videos')
+    parser.add_argument('source', help='Directorio con videos o manifiesto .json/.csv con path y ubicación')
+    parser.add_argument('--location', default=None, help='Ubicación por defecto "lat,lng" para los videos')
+    parser.add_argument('--regions', default=None, help='JSON con ROI y líneas de conteo por defecto')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--inference-backend', choices=list(INFERENCE_BACKENDS), default=DEFAULT_INFERENCE_BACKEND)
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--frame-stride', type=int, default=1)
+    parser.add_argument('--motion-threshold', type=float, default=None)
+    add_decode_arguments(parser)
+    parser.add_argument('--backend', choices=sorted(STORE_BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--store-path', default=None)
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER, help='Registro de videos ya procesados por hash')
+    parser.add_argument('--force', action='store_true', help='Procesar aunque el video ya esté en el registro')
+    args = parser.parse_args()
+
+    videos = find_videos(args.source, parse_location(args.location), load_regions(args.regions))
+    missing = [video['path'] for video in videos if not os.path.exists(video['path'])]
+    if missing:
+        parser.error(f"No existen: {', '.join(missing)}")
+
+    summary = run_batch(videos, open_store(args.backend, args.store_path), ProcessedLedger(args.ledger),
+                        workers=args.workers, force=args.force, confidence_threshold=args.confidence,
+                        model_name=args.model, batch_size=args.batch_size, frame_stride=args.frame_stride,
+                        motion_threshold=args.motion_threshold, decode_options=decode_options_from_args(args),
+                        inference_backend=args.inference_backend)
+    print(f"\nProcesados: {summary['processed']}, con error: {summary['failed']}, "
+          f"omitidos: {summary['skipped']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pandas as pd
+import psutil
+
+from detection_store import COLUMN_DTYPES, FIELDNAMES, TABLE_CARS, TABLE_DETECTIONS, CsvStore, open_store
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, INFERENCE_BACKENDS
+from video_analysis import analyze_video
+from video_io import add_decode_arguments, decode_options_from_args, open_video
+
+DEFAULT_VIDEO = '1900-151662242_small.mp4'
+DEFAULT_ROWS = [10000, 100000, 1000000]
+DEFAULT_OUTPUT = 'benchmark_results.json'
+SYNTHETIC_CHUNK_ROWS = 1000000
+SYNTHETIC_DAYS = 28
+SYNTHETIC_LOCATIONS = 50
+# Segundos entre muestras de la memoria residente durante cada medición
+RSS_SAMPLE_SECONDS = 0.05
+
+# Configuraciones de decodificación comparadas contra el camino actual (OpenCV con un hilo por defecto)
+DECODE_CONFIGS = {
+    'opencv': {'decoder': 'opencv'},
+    'opencv_threads': {'decoder': 'opencv', 'threads': os.cpu_count() or 1},
+    'ffmpeg': {'decoder': 'ffmpeg'},
+    'ffmpeg_640': {'decoder': 'ffmpeg', 'width': 640},
+    'ffmpeg_640_step2': {'decoder': 'ffmpeg', 'width': 640, 'frame_step': 2}
+}
+
+STATS_QUERIES = [
+    '/api/stats',
+    '/api/stats?day=0',
+    '/api/stats/filter?start=2024-01-08&end=2024-01-21',
+    '/api/stats/heatmap?zoom=12',
+    '/api/stats/heatmap?zoom=17&bbox=-66.16,-17.38,-66.13,-17.35&day=2',
+    '/api/timeseries?start=2024-01-01&end=2024-01-28&bucket=1h',
+    '/api/timeseries?start=2024-01-08&end=2024-01-14&bucket=15m&group_by=object_class,location'
+]
+
+# Métricas comparadas contra una ejecución anterior y si un valor mayor es mejor
+COMPARED_METRICS = {
+    ('video', 'fps'): True,
+    ('video', 'ms_per_frame', 'decode'): False,
+    ('video', 'ms_per_frame', 'inference'): False,
+    ('video', 'ms_per_frame', 'tracking'): False,
+    ('video', 'ms_per_frame', 'csv_write'): False,
+    ('video', 'peak_rss_mb'): False
+}
+
+
+class PeakMemory:
+    # Memoria residente máxima del proceso más sus hijos (workers de análisis) mientras dura el bloque. Se
+    # muestrea con psutil porque el módulo resource no existe en Windows.
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='muestreo-memoria', daemon=True)
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def mb(self):
+        return round(self.peak / (1024 * 1024), 1)
+
+    def _sample(self):
+        total = 0
+        for process in [self._process] + self._process.children(recursive=True):
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                # Un worker que terminó entre listarlo y leerlo
+                pass
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples, 95)), 2),
+        'max_ms': round(float(samples.max()), 2)
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def synthetic_detections(rows, seed=0, start_date='2024-01-01', days=SYNTHETIC_DAYS,
+                         locations=SYNTHETIC_LOCATIONS):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start_date).value
+    offsets = rng.integers(0, days * 86400, rows) * 1000000000
+    site = rng.integers(0, locations, rows)
+    x1 = rng.uniform(0, 1200, rows).round(1)
+    y1 = rng.uniform(0, 600, rows).round(1)
+    width = rng.uniform(20, 200, rows).round(1)
+    height = rng.uniform(20, 150, rows).round(1)
+    frame_number = rng.integers(1, 100000, rows)
+
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime(start + np.sort(offsets)),
+        'frame_number': frame_number,
+        'time_seconds': (frame_number / 30).round(2),
+        'object_class': 'car',
+        'confidence': rng.uniform(0.5, 1.0, rows).round(3),
+        'bbox_x1': x1,
+        'bbox_y1': y1,
+        'bbox_x2': x1 + width,
+        'bbox_y2': y1 + height,
+        'bbox_width': width,
+        'bbox_height': height,
+        'bbox_center_x': (x1 + width / 2).round(1),
+        'bbox_center_y': (y1 + height / 2).round(1),
+        'location_lat': (-17.38 + site * 0.001).round(6),
+        'location_lng': (-66.16 + site * 0.001).round(6)
+    })
+    return df[FIELDNAMES].astype(COLUMN_DTYPES)
+
+
+def fill_store(store, table, rows, chunk_rows=SYNTHETIC_CHUNK_ROWS):
+    start = time.perf_counter()
+    for chunk, offset in enumerate(range(0, rows, chunk_rows)):
+        store.append_frame(table, synthetic_detections(min(chunk_rows, rows - offset), seed=chunk))
+    return time.perf_counter() - start
+
+
+def bench_decode(video_path, configs=DECODE_CONFIGS):
+    results = {}
+    for name, options in configs.items():
+        try:
+            cap = open_video(video_path, **options)
+        except (RuntimeError, ValueError) as e:
+            print(f"  Decodificador {name} omitido: {e}")
+            continue
+        if not cap.isOpened():
+            continue
+
+        recycle = getattr(cap, 'recycle', None)
+        frames = 0
+        start = time.perf_counter()
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames += 1
+            if recycle is not None:
+                recycle(frame)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'options': options,
+            'frames': frames,
+            'resolution': f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}",
+            'fps': round(frames / elapsed, 2) if elapsed > 0 else None,
+            'ms_per_frame': round(elapsed * 1000 / max(1, frames), 3)
+        }
+        cap.release()
+    return results
+
+
+def bench_video(video_path, model_name=DEFAULT_MODEL, batch_size=1, frame_stride=1, motion_threshold=None,
+                workers=1, decode_options=None, inference_backend=DEFAULT_INFERENCE_BACKEND):
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        analysis = analyze_video(video_path, workers=workers, model_name=model_name, batch_size=batch_size,
+                                 frame_stride=frame_stride, motion_threshold=motion_threshold,
+                                 decode_options=decode_options, inference_backend=inference_backend)
+        elapsed = time.perf_counter() - start
+        if 'error' in analysis:
+            raise RuntimeError(analysis['error'])
+
+        # La escritura CSV se mide aparte sobre un directorio temporal para no tocar los datos reales
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CsvStore(tmp)
+            write_start = time.perf_counter()
+            store.append(TABLE_DETECTIONS, analysis['detections'])
+            store.append(TABLE_CARS, [d for d in analysis['detections'] if d['object_class'] == 'car'])
+            write_seconds = time.perf_counter() - write_start
+
+    stages = analysis['stage_stats']
+    frames = max(1, analysis['frames'])
+    ms_per_frame = {name: round(stages[name]['busy_seconds'] * 1000 / frames, 3)
+                    for name in ('decode', 'inference', 'tracking') if name in stages}
+    ms_per_frame['csv_write'] = round(write_seconds * 1000 / frames, 3)
+
+    return {
+        'video': video_path,
+        'model': model_name,
+        'batch_size': batch_size,
+        'frame_stride': frame_stride,
+        'motion_threshold': motion_threshold,
+        'workers': workers,
+        'decode_options': decode_options,
+        'inference_backend': inference_backend,
+        'frames': analysis['frames'],
+        'inferred_frames': stages['total']['inferred_frames'],
+        'detections': len(analysis['detections']),
+        'wall_seconds': round(elapsed + write_seconds, 3),
+        'fps': round(analysis['frames'] / (elapsed + write_seconds), 2),
+        'ms_per_frame': ms_per_frame,
+        'peak_rss_mb': memory.mb
+    }
+
+
+def bench_stats(rows, backend='sqlite', requests_per_query=30):
+    import app as web
+
+    with PeakMemory() as memory, tempfile.TemporaryDirectory() as tmp:
+        path = tmp if backend == 'csv' else os.path.join(tmp, f'bench.{backend}')
+        store = open_store(backend, path)
+        # /api/timeseries consulta todas las detecciones; las sintéticas son autos, así que ambas tablas coinciden
+        fill_seconds = fill_store(store, TABLE_CARS, rows) + fill_store(store, TABLE_DETECTIONS, rows)
+
+        web._store = store
+        client = web.app.test_client()
+        queries = {}
+        for query in STATS_QUERIES:
+            cold, warm = [], []
+            for _ in range(requests_per_query):
+                # Sin caché mide el cálculo completo (incluido el índice del mapa de calor); con caché, el
+                # camino habitual del dashboard
+                web.response_cache.clear()
+                web._spatial_index = (None, None)
+                start = time.perf_counter()
+                response = client.get(query)
+                cold.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{query} respondió {response.status_code}")
+                start = time.perf_counter()
+                client.get(query)
+                warm.append(time.perf_counter() - start)
+            queries[query] = {'uncached': percentiles(cold), 'cached': percentiles(warm)}
+        web._store = None
+        web._spatial_index = (None, None)
+
+    return {
+        'backend': backend,
+        'rows': rows,
+        'fill_seconds': round(fill_seconds, 3),
+        'rows_per_second': round(2 * rows / fill_seconds) if fill_seconds > 0 else None,
+        'queries': queries,
+        'peak_rss_mb': memory.mb
+    }
+
+
+def _metric(results, path):
+    value = results
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_results(results, baseline):
+    print("\n=== COMPARACIÓN CON LA LÍNEA BASE ===")
+    for path, higher_is_better in COMPARED_METRICS.items():
+        current, previous = _metric(results, path), _metric(baseline, path)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {'.'.join(path)}: {previous} -> {current} ({change:+.1f}%{', mejor' if better else ''})")
+
+    for name, entry in results.get('decode', {}).items():
+        previous = baseline.get('decode', {}).get(name)
+        if previous and previous.get('fps') and entry['fps']:
+            change = (entry['fps'] - previous['fps']) / previous['fps'] * 100
+            print(f"  decode.{name}.fps: {previous['fps']} -> {entry['fps']} ({change:+.1f}%)")
+
+    previous_stats = {(entry['backend'], entry['rows']): entry for entry in baseline.get('stats', [])}
+    for entry in results.get('stats', []):
+        previous = previous_stats.get((entry['backend'], entry['rows']))
+        if previous is None:
+            continue
+        for query, timings in entry['queries'].items():
+            before = previous['queries'].get(query, {}).get('uncached', {}).get('p95_ms')
+            if before:
+                after = timings['uncached']['p95_ms']
+                print(f"  {entry['backend']} {entry['rows']} filas {query} p95: {before} -> {after} ms "
+                      f"({(after - before) / before * 100:+.1f}%)")
+
+
+def print_results(results):
+    decode = results.get('decode')
+    if decode:
+        print("\n=== DECODIFICACIÓN ===")
+        for name, entry in decode.items():
+            print(f"  {name} ({entry['resolution']}): {entry['frames']} frames, {entry['fps']} FPS, "
+                  f"{entry['ms_per_frame']} ms/frame")
+    video = results.get('video')
+    if video:
+        print("\n=== VIDEO ===")
+        print(f"  {video['frames']} frames ({video['inferred_frames']} con inferencia) en "
+              f"{video['wall_seconds']}s: {video['fps']} FPS, pico de memoria {video['peak_rss_mb']} MB")
+        for name, ms in video['ms_per_frame'].items():
+            print(f"  {name}: {ms} ms/frame")
+    for entry in results.get('stats', []):
+        print(f"\n=== ESTADÍSTICAS ({entry['backend']}, {entry['rows']} filas, "
+              f"carga {entry['fill_seconds']}s) ===")
+        for query, timings in entry['queries'].items():
+            print(f"  {query}: p50 {timings['uncached']['p50_ms']} ms, p95 {timings['uncached']['p95_ms']} ms "
+                  f"(en caché p95 {timings['cached']['p95_ms']} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mide el rendimiento del pipeline de detección y de /api/stats')
+    parser.add_argument('--video', default=DEFAULT_VIDEO)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--inference-backend', choices=list(INFERENCE_BACKENDS), default=DEFAULT_INFERENCE_BACKEND)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--frame-stride', type=int, default=1)
+    parser.add_argument('--motion-threshold', type=float, default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    add_decode_arguments(parser)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help='Tamaños de las tablas sintéticas (por ejemplo 10000 1000000 10000000)')
+    parser.add_argument('--backend', default='sqlite', choices=['csv', 'sqlite', 'parquet'])
+    parser.add_argument('--requests', type=int, default=30, help='Peticiones por consulta de estadísticas')
+    parser.add_argument('--skip-decode', action='store_true',
+                        help='No comparar los decodificadores (OpenCV, hilos, FFmpeg y escalado)')
+    parser.add_argument('--skip-video', action='store_true')
+    parser.add_argument('--skip-stats', action='store_true')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=None, help='Resultados JSON anteriores para comparar')
+    args = parser.parse_args()
+
+    results = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': environment()
+    }
+    if not args.skip_decode:
+        results['decode'] = bench_decode(args.video)
+    if not args.skip_video:
+        results['video'] = bench_video(args.video, args.model, args.batch_size, args.frame_stride,
+                                       args.motion_threshold, args.workers, decode_options_from_args(args),
+                                       args.inference_backend)
+    if not args.skip_stats:
+        results['stats'] = [bench_stats(rows, args.backend, args.requests) for rows in args.rows]
+
+    print_results(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResultados guardados en: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare_results(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Nombres como 20240315_083000.mp4, VID_2024-03-15_08-30-00.mp4 o cam1 2024-03-15T08.30.00.avi (hora local)
+FILENAME_TIME_PATTERN = re.compile(
+    r'(?P<Y>(?:19|20)\d{2})-?(?P<m>\d{2})-?(?P<d>\d{2})[_T -]?(?P<H>\d{2})[-:.]?(?P<M>\d{2})[-:.]?(?P<S>\d{2})')
+# Origen del inicio de la grabación, del más confiable al último recurso
+TIME_SOURCES = ('parameter', 'metadata', 'filename', 'processing')
+# Segundos entre 1904-01-01 (época de los átomos mvhd de MP4/MOV) y 1970-01-01
+MP4_EPOCH_OFFSET = 2082844800
+MP4_CONTAINER_BOXES = {b'moov', b'trak', b'mdia'}
+
+
+def parse_start_time(value):
+    # Época en segundos, o fecha "AAAA-MM-DD HH:MM:SS" en hora local salvo que indique zona horaria
+    if value is None or isinstance(value, (int, float)):
+        return value
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.to_pydatetime().timestamp()
+    return timestamp.timestamp()
+
+
+def _mp4_boxes(f, end):
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        size, kind = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, start + size
+        f.seek(start + size)
+
+
+def _mp4_creation_time(path):
+    # Lee solo las cabeceras de los átomos hasta moov/mvhd, sin recorrer los datos del video
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        for kind, body, box_end in _mp4_boxes(f, end):
+            if kind != b'moov':
+                continue
+            f.seek(body)
+            for child, child_body, _ in _mp4_boxes(f, box_end):
+                if child != b'mvhd':
+                    continue
+                f.seek(child_body)
+                version = f.read(1)[0]
+                f.read(3)
+                created = struct.unpack('>Q' if version == 1 else '>I', f.read(8 if version == 1 else 4))[0]
+                # Cero significa que el grabador no completó el campo
+                return created - MP4_EPOCH_OFFSET if created else None
+            return None
+    return None
+
+
+def _ffprobe_creation_time(path, ffprobe):
+    output = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_entries', 'format_tags=creation_time:stream_tags=creation_time',
+         '-of', 'json', path],
+        capture_output=True, text=True, check=True).stdout
+    info = json.loads(output)
+    tags = [info.get('format', {}).get('tags', {})] + [stream.get('tags', {}) for stream in info.get('streams', [])]
+    for value in (tag.get('creation_time') for tag in tags):
+        if value:
+            return parse_start_time(value)
+    return None
+
+
+def metadata_start_time(path, ffprobe='ffprobe'):
+    ffprobe = shutil.which(ffprobe)
+    try:
+        if ffprobe is not None:
+            created = _ffprobe_creation_time(path, ffprobe)
+        else:
+            created = _mp4_creation_time(path)
+    except (OSError, subprocess.CalledProcessError, struct.error, ValueError, IndexError):
+        return None
+    # Grabadores sin reloj configurado escriben 1970 o 1904; esas fechas no sirven para las estadísticas
+    if created is None or created < datetime(2000, 1, 1, tzinfo=timezone.utc).timestamp():
+        return None
+    return created
+
+
+def filename_start_time(path, pattern=FILENAME_TIME_PATTERN):
+    match = pattern.search(os.path.basename(path))
+    if match is None:
+        return None
+    try:
+        parts = {name: int(value) for name, value in match.groupdict().items()}
+        return datetime(parts['Y'], parts['m'], parts['d'], parts['H'], parts['M'], parts['S']).timestamp()
+    except ValueError:
+        return None
+
+
+def capture_start_time(path, start_time=None, pattern=FILENAME_TIME_PATTERN):
+    # Momento en que empezó la grabación: cada detección es este inicio más su time_seconds.
+    # Sin ninguna fuente se usa el inicio del análisis, como antes, pero constante en todo el video.
+    if start_time is not None:
+        return parse_start_time(start_time), 'parameter'
+    created = metadata_start_time(path)
+    if created is not None:
+        return created, 'metadata'
+    from_name = filename_start_time(path, pattern)
+    if from_name is not None:
+        return from_name, 'filename'
+    return time.time(), 'processing'
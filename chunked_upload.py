@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from analysis_cache import remember_hash
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+class UploadSessions:
+    def __init__(self, upload_folder, max_size=None):
+        self.upload_folder = upload_folder
+        self.partial_folder = os.path.join(upload_folder, '.partial')
+        self.max_size = max_size
+        # Hash parcial de cada subida en curso, con el offset hasta el que abarca
+        self._digests = {}
+        # Un lock por subida: la verificación del offset, la escritura y el hash ocurren juntos
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError('Identificador de subida no válido', 404)
+        base = os.path.join(self.partial_folder, upload_id)
+        return base + '.part', base + '.json'
+
+    def _lock(self, upload_id):
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _digest(self, upload_id, offset):
+        # El hash avanza con cada bloque recibido; si el proceso se reinició se recalcula desde la parte guardada
+        saved = self._digests.pop(upload_id, None)
+        if saved is not None and saved[0] == offset:
+            return saved[1]
+        part_path, _ = self._paths(upload_id)
+        digest = hashlib.sha256()
+        remaining = offset
+        with open(part_path, 'rb') as part:
+            while remaining > 0:
+                chunk = part.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest
+
+    def create(self, filename, total_size=None, location=None, regions=None, start_time=None):
+        if total_size is not None and self.max_size is not None and total_size > self.max_size:
+            raise UploadError('El archivo excede el tamaño máximo permitido', 413)
+        os.makedirs(self.partial_folder, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'filename': secure_filename(filename),
+                'total_size': total_size,
+                'location': location,
+                'regions': regions,
+                'start_time': start_time
+            }, f)
+        open(part_path, 'wb').close()
+        return upload_id
+
+    def info(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Subida no encontrada', 404)
+        info['upload_id'] = upload_id
+        info['offset'] = os.path.getsize(part_path)
+        return info
+
+    def append(self, upload_id, offset, stream):
+        # Dos reintentos con el mismo offset no pueden pasar ambos la verificación y escribir dos veces
+        part_path, _ = self._paths(upload_id)
+        with self._lock(upload_id):
+            info = self.info(upload_id)
+            # El cliente debe continuar exactamente donde quedó el servidor para poder reanudar
+            if offset != info['offset']:
+                raise UploadError('Offset no coincide con los datos recibidos', 409, info['offset'])
+
+            digest = self._digest(upload_id, offset)
+            size = offset
+            with open(part_path, 'ab') as part:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    limit = info['total_size'] if info['total_size'] is not None else self.max_size
+                    if limit is not None and size > limit:
+                        part.truncate(offset)
+                        raise UploadError('Se recibieron más datos de los declarados', 413, offset)
+                    part.write(chunk)
+                    digest.update(chunk)
+            self._digests[upload_id] = (size, digest)
+            return size
+
+    def complete(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        with self._lock(upload_id):
+            info = self.info(upload_id)
+            if info['total_size'] is not None and info['offset'] != info['total_size']:
+                raise UploadError('La subida está incompleta', 409, info['offset'])
+            if not info['filename']:
+                raise UploadError('Nombre de archivo no válido')
+
+            digest = self._digest(upload_id, info['offset'])
+            filepath = os.path.join(self.upload_folder, info['filename'])
+            os.replace(part_path, filepath)
+            os.remove(meta_path)
+            info['filepath'] = filepath
+            info['sha256'] = digest.hexdigest()
+            remember_hash(filepath, info['sha256'])
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        return info
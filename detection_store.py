@@ -0,0 +1,815 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+TABLE_DETECTIONS = 'detecciones_completas'
+TABLE_CARS = 'autos_solo'
+TABLES = (TABLE_DETECTIONS, TABLE_CARS)
+
+FIELDNAMES = [
+    'timestamp', 'frame_number', 'time_seconds', 'object_class', 'confidence',
+    'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2',
+    'bbox_width', 'bbox_height', 'bbox_center_x', 'bbox_center_y',
+    'location_lat', 'location_lng'
+]
+
+COLUMN_DTYPES = {
+    'timestamp': 'datetime64[ns]',
+    'frame_number': 'int64',
+    'time_seconds': 'float64',
+    'object_class': 'string',
+    'confidence': 'float64',
+    'bbox_x1': 'float64',
+    'bbox_y1': 'float64',
+    'bbox_x2': 'float64',
+    'bbox_y2': 'float64',
+    'bbox_width': 'float64',
+    'bbox_height': 'float64',
+    'bbox_center_x': 'float64',
+    'bbox_center_y': 'float64',
+    'location_lat': 'float64',
+    'location_lng': 'float64'
+}
+
+SQL_TYPES = {
+    'timestamp': 'TEXT NOT NULL',
+    'frame_number': 'INTEGER NOT NULL',
+    'object_class': 'TEXT NOT NULL'
+}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Celdas de ubicación de ~11 m para los agregados
+ROLLUP_LOCATION_DECIMALS = 4
+ROLLUP_KEYS = ['date', 'hour', 'object_class', 'location_lat', 'location_lng']
+ROLLUP_COLUMNS = ROLLUP_KEYS + ['count', 'confidence_sum']
+ROLLUP_DTYPES = {
+    'date': 'datetime64[ns]',
+    'hour': 'int64',
+    'object_class': 'string',
+    'location_lat': 'float64',
+    'location_lng': 'float64',
+    'count': 'int64',
+    'confidence_sum': 'float64'
+}
+
+# Segundos tras los que el lock de agregados de un proceso que murió sin liberarlo se da por abandonado
+ROLLUP_LOCK_TIMEOUT = 60
+# Los temporales de Parquet empiezan con punto, que pyarrow ignora al leer un directorio; pasado este tiempo
+# se consideran restos de un proceso que murió antes del os.replace
+STALE_TEMP_SECONDS = 3600
+# Clave de los metadatos de cada archivo de agregados de Parquet con las partes que ya suma
+ROLLUP_PARTS_KEY = b'parts'
+# Partes de un mismo día a partir de las cuales se combinan en una sola
+PARQUET_COMPACT_PARTS = 16
+# Registro de una compactación en curso dentro de la partición, para terminarla si el proceso muere
+COMPACTION_JOURNAL = '_compactacion.json'
+
+# Filas por bloque al recorrer un CSV buscando un rango de fechas
+CSV_RANGE_CHUNK_ROWS = 200000
+
+DEFAULT_BACKEND = 'sqlite'
+DEFAULT_PATHS = {
+    'csv': '.',
+    'sqlite': 'detecciones.db',
+    'parquet': 'detecciones_parquet'
+}
+
+
+def fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def detections_to_frame(detections_data, location=None):
+    df = pd.DataFrame.from_records(list(detections_data), columns=FIELDNAMES)
+    if location:
+        df['location_lat'] = location['lat']
+        df['location_lng'] = location['lng']
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+    return df.astype(COLUMN_DTYPES)
+
+
+def empty_frame(columns=None):
+    return detections_to_frame([])[columns or FIELDNAMES]
+
+
+def rollup_frame(df):
+    # Conteos y suma de confianza por (día, hora, clase, ubicación)
+    keys = pd.DataFrame({
+        'date': df['timestamp'].dt.normalize(),
+        'hour': df['timestamp'].dt.hour.astype('int64'),
+        'object_class': df['object_class'],
+        'location_lat': df['location_lat'].round(ROLLUP_LOCATION_DECIMALS),
+        'location_lng': df['location_lng'].round(ROLLUP_LOCATION_DECIMALS)
+    })
+    rollup = df.groupby([keys[name] for name in ROLLUP_KEYS], dropna=False).agg(
+        count=('confidence', 'size'),
+        confidence_sum=('confidence', 'sum')
+    ).reset_index()
+    return rollup.astype(ROLLUP_DTYPES)[ROLLUP_COLUMNS]
+
+
+def bucket_frame(df, bucket_seconds, group_by=()):
+    # Conteos por intervalo fijo (alineado a la época) y, opcionalmente, por clase y celda de ubicación
+    keys = pd.DataFrame({'bucket': df['timestamp'].dt.floor(pd.Timedelta(seconds=bucket_seconds))})
+    if 'object_class' in group_by:
+        keys['object_class'] = df['object_class']
+    if 'location' in group_by:
+        keys['location_lat'] = df['location_lat'].round(ROLLUP_LOCATION_DECIMALS)
+        keys['location_lng'] = df['location_lng'].round(ROLLUP_LOCATION_DECIMALS)
+    buckets = df.groupby([keys[name] for name in keys.columns], dropna=False).agg(
+        count=('confidence', 'size'),
+        confidence_sum=('confidence', 'sum')
+    ).reset_index()
+    return buckets.astype({'count': 'int64', 'confidence_sum': 'float64'})
+
+
+def filter_frame(df, classes=None, bbox=None):
+    if classes:
+        df = df[df['object_class'].isin(classes)]
+    if bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        df = df[df['location_lng'].between(min_lng, max_lng) & df['location_lat'].between(min_lat, max_lat)]
+    return df
+
+
+def merge_rollups(rollup):
+    merged = rollup.groupby(ROLLUP_KEYS, dropna=False)[['count', 'confidence_sum']].sum().reset_index()
+    return merged.astype(ROLLUP_DTYPES)[ROLLUP_COLUMNS]
+
+
+@contextmanager
+def file_lock(lock_path, timeout=ROLLUP_LOCK_TIMEOUT):
+    # Exclusión entre procesos con un archivo creado en forma exclusiva (funciona igual en Windows)
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+class DetectionStore:
+    def append_frame(self, table, df):
+        raise NotImplementedError
+
+    def count(self, table):
+        raise NotImplementedError
+
+    def read(self, table, columns=None):
+        raise NotImplementedError
+
+    def read_rollup(self, table):
+        # Sin agregados persistidos se calculan a partir de las filas
+        return rollup_frame(self.read(table))
+
+    def read_range(self, table, start=None, end=None, columns=None):
+        # Filas con start <= timestamp < end; los backends con índice por tiempo evitan leer el resto
+        df = self.read(table, columns)
+        return df[_range_mask(df['timestamp'], start, end)]
+
+    def time_buckets(self, table, start, end, bucket_seconds, group_by=(), classes=None, bbox=None):
+        columns = ['timestamp', 'object_class', 'confidence', 'location_lat', 'location_lng']
+        df = filter_frame(self.read_range(table, start, end, columns), classes, bbox)
+        return bucket_frame(df, bucket_seconds, group_by)
+
+    def version(self):
+        # Las tablas solo crecen, así que el total de filas identifica el estado de los datos
+        return sum(self.count(table) for table in TABLES)
+
+    def append(self, table, detections_data, location=None):
+        df = detections_to_frame(detections_data, location)
+        if len(df):
+            self.append_frame(table, df)
+        return len(df)
+
+
+def _range_mask(timestamps, start=None, end=None):
+    mask = pd.Series(True, index=timestamps.index)
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps < end
+    return mask
+
+
+class CsvStore(DetectionStore):
+    def __init__(self, path=DEFAULT_PATHS['csv'], fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+    def _csv_path(self, table):
+        return os.path.join(self.path, f'{table}.csv')
+
+    def _meta_path(self, table):
+        return os.path.join(self.path, f'.{table}.meta.json')
+
+    def _rollup_path(self, table):
+        return os.path.join(self.path, f'.{table}.rollup.json')
+
+    def _write_count(self, table, row_count):
+        with open(self._meta_path(table), 'w', encoding='utf-8') as f:
+            json.dump({'row_count': row_count}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _load_rollup(self, table):
+        # (filas del CSV que ya suma, agregados); sin archivo se parte de cero
+        try:
+            with open(self._rollup_path(table), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            rollup = pd.DataFrame.from_records(saved['rollup'], columns=ROLLUP_COLUMNS)
+            rollup['date'] = pd.to_datetime(rollup['date'], format='%Y-%m-%d')
+            return saved['rows'], rollup.astype(ROLLUP_DTYPES)
+        except (OSError, ValueError, KeyError):
+            return 0, rollup_frame(empty_frame())
+
+    def _save_rollup(self, table, rows, rollup):
+        # Los agregados y la cantidad de filas que suman se reemplazan juntos; el temporal es por proceso
+        # porque la app y los workers pueden escribirlo a la vez
+        records = rollup.assign(date=rollup['date'].dt.strftime('%Y-%m-%d')).astype(object)
+        records = records.where(records.notna(), None).to_dict('records')
+        temporary = f"{self._rollup_path(table)}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows, 'rollup': records}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, self._rollup_path(table))
+
+    def count(self, table):
+        csv_filename = self._csv_path(table)
+        if not os.path.exists(csv_filename):
+            return 0
+        try:
+            with open(self._meta_path(table), 'r', encoding='utf-8') as f:
+                return json.load(f)['row_count']
+        except (OSError, ValueError, KeyError):
+            # Sin metadatos (archivo heredado): se cuentan las filas una sola vez
+            with open(csv_filename, 'r', encoding='utf-8') as f:
+                row_count = max(0, sum(1 for line in f) - 1)
+            self._write_count(table, row_count)
+            return row_count
+
+    def append_frame(self, table, df):
+        csv_filename = self._csv_path(table)
+        row_count = self.count(table)
+        file_exists = os.path.exists(csv_filename) and os.path.getsize(csv_filename) > 0
+        rows = df.copy()
+        rows['timestamp'] = rows['timestamp'].dt.strftime(TIMESTAMP_FORMAT)
+        with open(csv_filename, 'a', encoding='utf-8', newline='') as f:
+            rows.to_csv(f, header=not file_exists, index=False)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._write_count(table, row_count + len(df))
+
+        # Los agregados se actualizan con el lote si estaban al día; si no, read_rollup los completa
+        rollup_rows, rollup = self._load_rollup(table)
+        if rollup_rows == row_count:
+            rollup = merge_rollups(pd.concat([rollup, rollup_frame(df)], ignore_index=True))
+            self._save_rollup(table, row_count + len(df), rollup)
+
+    def read(self, table, columns=None):
+        csv_filename = self._csv_path(table)
+        if not os.path.exists(csv_filename):
+            return empty_frame(columns)
+        df = pd.read_csv(csv_filename, usecols=lambda name: name in FIELDNAMES)
+        df = df.reindex(columns=FIELDNAMES)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+        return df.astype(COLUMN_DTYPES)[columns or FIELDNAMES]
+
+    def read_rollup(self, table):
+        # Agregados guardados junto al CSV, como el conteo de filas; solo se leen las filas que aún no suman
+        # (un archivo heredado la primera vez, o lotes que otro proceso agregó mientras se guardaban)
+        row_count = self.count(table)
+        rollup_rows, rollup = self._load_rollup(table)
+        if rollup_rows == row_count:
+            return rollup
+        if rollup_rows > row_count:
+            # El CSV se reemplazó por uno más corto: se recalcula desde el principio
+            rollup_rows, rollup = 0, rollup_frame(empty_frame())
+        tail = pd.read_csv(self._csv_path(table), usecols=lambda name: name in FIELDNAMES,
+                           skiprows=range(1, rollup_rows + 1), nrows=row_count - rollup_rows)
+        tail = tail.reindex(columns=FIELDNAMES)
+        tail['timestamp'] = pd.to_datetime(tail['timestamp'], format=TIMESTAMP_FORMAT)
+        rollup = merge_rollups(pd.concat([rollup, rollup_frame(tail.astype(COLUMN_DTYPES))], ignore_index=True))
+        self._save_rollup(table, row_count, rollup)
+        return rollup
+
+    def read_range(self, table, start=None, end=None, columns=None):
+        # El CSV no tiene índice: se recorre por bloques y solo se conservan las filas del rango
+        csv_filename = self._csv_path(table)
+        columns = columns or FIELDNAMES
+        if not os.path.exists(csv_filename):
+            return empty_frame(columns)
+        chunks = []
+        for chunk in pd.read_csv(csv_filename, usecols=lambda name: name in columns, chunksize=CSV_RANGE_CHUNK_ROWS):
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], format=TIMESTAMP_FORMAT)
+            chunks.append(chunk[_range_mask(chunk['timestamp'], start, end)])
+        if not chunks:
+            return empty_frame(columns)
+        df = pd.concat(chunks, ignore_index=True).reindex(columns=columns)
+        return df.astype({name: COLUMN_DTYPES[name] for name in columns})
+
+
+class SqliteStore(DetectionStore):
+    def __init__(self, path=DEFAULT_PATHS['sqlite'], fsync=False):
+        self.path = path
+        self.fsync = fsync
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('CREATE TABLE IF NOT EXISTS table_stats (table_name TEXT PRIMARY KEY, row_count INTEGER NOT NULL)')
+            for table in TABLES:
+                columns = ', '.join(f'{name} {SQL_TYPES.get(name, "REAL")}' for name in FIELDNAMES)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)')
+                conn.execute('INSERT OR IGNORE INTO table_stats (table_name, row_count) VALUES (?, 0)', (table,))
+                self._create_rollup(conn, table)
+
+    def _create_rollup(self, conn, table):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (f'{table}_rollup',)).fetchone()
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table}_rollup (date TEXT NOT NULL, hour INTEGER NOT NULL, '
+                     f'object_class TEXT NOT NULL, location_lat REAL, location_lng REAL, '
+                     f'count INTEGER NOT NULL, confidence_sum REAL NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_rollup_key ON {table}_rollup (date, hour)')
+        if not exists:
+            # Bases creadas antes de existir los agregados: se calculan una vez desde las filas
+            self._update_rollup(conn, table, self._read_rows(conn, table, FIELDNAMES))
+
+    def _update_rollup(self, conn, table, df):
+        rollup = rollup_frame(df)
+        rollup['date'] = rollup['date'].dt.strftime('%Y-%m-%d')
+        for date, hour, object_class, lat, lng, count, confidence_sum in zip(
+                *(rollup[name].tolist() for name in ROLLUP_COLUMNS)):
+            lat = None if pd.isna(lat) else lat
+            lng = None if pd.isna(lng) else lng
+            updated = conn.execute(
+                f'UPDATE {table}_rollup SET count = count + ?, confidence_sum = confidence_sum + ? '
+                f'WHERE date = ? AND hour = ? AND object_class = ? AND location_lat IS ? AND location_lng IS ?',
+                (count, confidence_sum, date, hour, object_class, lat, lng)
+            ).rowcount
+            if not updated:
+                conn.execute(f'INSERT INTO {table}_rollup ({", ".join(ROLLUP_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (date, hour, object_class, lat, lng, count, confidence_sum))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # Con WAL, NORMAL puede perder las últimas transacciones ante un corte de energía; FULL sincroniza cada una
+        conn.execute(f'PRAGMA synchronous={"FULL" if self.fsync else "NORMAL"}')
+        return conn
+
+    def _check_table(self, table):
+        if table not in TABLES:
+            raise ValueError(f"Tabla desconocida: {table}")
+
+    def count(self, table):
+        self._check_table(table)
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT row_count FROM table_stats WHERE table_name = ?', (table,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def version(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT SUM(row_count) FROM table_stats').fetchone()[0] or 0
+        finally:
+            conn.close()
+
+    def append_frame(self, table, df):
+        self._check_table(table)
+        rows = df.copy()
+        rows['timestamp'] = rows['timestamp'].dt.strftime(TIMESTAMP_FORMAT)
+        values = zip(*(rows[name].tolist() for name in FIELDNAMES))
+        placeholders = ', '.join('?' for _ in FIELDNAMES)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(f'INSERT INTO {table} ({", ".join(FIELDNAMES)}) VALUES ({placeholders})',
+                                 values)
+                conn.execute('UPDATE table_stats SET row_count = row_count + ? WHERE table_name = ?',
+                             (len(rows), table))
+                self._update_rollup(conn, table, df)
+        finally:
+            conn.close()
+
+    def read(self, table, columns=None):
+        self._check_table(table)
+        conn = self._connect()
+        try:
+            return self._read_rows(conn, table, columns or FIELDNAMES)
+        finally:
+            conn.close()
+
+    def _read_rows(self, conn, table, columns, where='', params=()):
+        df = pd.read_sql_query(f'SELECT {", ".join(columns)} FROM {table}{where}', conn, params=params)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+        return df.astype({name: COLUMN_DTYPES[name] for name in columns})
+
+    def _range_where(self, start, end, classes=None, bbox=None):
+        # timestamp es texto con formato fijo, así que se compara como cadena y usa el índice
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(pd.Timestamp(start).strftime(TIMESTAMP_FORMAT))
+        if end is not None:
+            conditions.append('timestamp < ?')
+            params.append(pd.Timestamp(end).strftime(TIMESTAMP_FORMAT))
+        if classes:
+            conditions.append(f'object_class IN ({", ".join("?" for _ in classes)})')
+            params.extend(classes)
+        if bbox is not None:
+            conditions.append('location_lng BETWEEN ? AND ? AND location_lat BETWEEN ? AND ?')
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def read_range(self, table, start=None, end=None, columns=None):
+        self._check_table(table)
+        where, params = self._range_where(start, end)
+        conn = self._connect()
+        try:
+            return self._read_rows(conn, table, columns or FIELDNAMES, where, params)
+        finally:
+            conn.close()
+
+    def time_buckets(self, table, start, end, bucket_seconds, group_by=(), classes=None, bbox=None):
+        # Se agrupa dentro de SQLite: solo viajan los intervalos, no las filas
+        self._check_table(table)
+        where, params = self._range_where(start, end, classes, bbox)
+        keys = [f"(CAST(strftime('%s', timestamp) AS INTEGER) / {int(bucket_seconds)}) * {int(bucket_seconds)} "
+                "AS bucket"]
+        if 'object_class' in group_by:
+            keys.append('object_class')
+        if 'location' in group_by:
+            keys.append(f'ROUND(location_lat, {ROLLUP_LOCATION_DECIMALS}) AS location_lat')
+            keys.append(f'ROUND(location_lng, {ROLLUP_LOCATION_DECIMALS}) AS location_lng')
+        names = [key.split(' AS ')[-1] for key in keys]
+        query = (f'SELECT {", ".join(keys)}, COUNT(*) AS count, SUM(confidence) AS confidence_sum '
+                 f'FROM {table}{where} GROUP BY {", ".join(names)}')
+        conn = self._connect()
+        try:
+            buckets = pd.read_sql_query(query, conn, params=params)
+        finally:
+            conn.close()
+        buckets['bucket'] = pd.to_datetime(buckets['bucket'], unit='s')
+        return buckets.astype({'count': 'int64', 'confidence_sum': 'float64'})
+
+    def read_rollup(self, table):
+        self._check_table(table)
+        conn = self._connect()
+        try:
+            rollup = pd.read_sql_query(f'SELECT {", ".join(ROLLUP_COLUMNS)} FROM {table}_rollup', conn)
+        finally:
+            conn.close()
+        rollup['date'] = pd.to_datetime(rollup['date'], format='%Y-%m-%d')
+        return rollup.astype(ROLLUP_DTYPES)
+
+
+class ParquetStore(DetectionStore):
+    def __init__(self, path=DEFAULT_PATHS['parquet'], fsync=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("El backend Parquet requiere pyarrow (pip install pyarrow)")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.path = path
+        self.fsync = fsync
+        for table in TABLES:
+            os.makedirs(self._table_path(table), exist_ok=True)
+            os.makedirs(self._rollup_path(table), exist_ok=True)
+            self._remove_stale_temporaries(table)
+            self._sync_rollup(table)
+
+    def _meta_path(self, table):
+        return os.path.join(self.path, f'.{table}.meta.json')
+
+    def _write_count(self, table, row_count):
+        with open(self._meta_path(table), 'w', encoding='utf-8') as f:
+            json.dump({'row_count': row_count}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _table_path(self, table):
+        if table not in TABLES:
+            raise ValueError(f"Tabla desconocida: {table}")
+        return os.path.join(self.path, table)
+
+    def _rollup_path(self, table):
+        return self._table_path(table) + '_rollup'
+
+    def _rollup_day_file(self, table, day):
+        return os.path.join(self._rollup_path(table), f'date={day}.parquet')
+
+    def _partition_path(self, table, day):
+        return os.path.join(self._table_path(table), f'date={day}')
+
+    def _part_files(self, table):
+        # Las partes ya copiadas a un archivo compactado visible se omiten aunque todavía no se hayan borrado
+        parts = glob.glob(os.path.join(self._table_path(table), 'date=*', '*.parquet'))
+        superseded = set()
+        for journal_path in glob.glob(os.path.join(self._table_path(table), 'date=*', COMPACTION_JOURNAL)):
+            partition = os.path.dirname(journal_path)
+            journal = self._read_journal(partition)
+            if journal is not None and os.path.join(partition, journal['into']) in parts:
+                superseded.update(os.path.join(partition, name) for name in journal['parts'])
+        return [part for part in parts if part not in superseded]
+
+    def _rollup_files(self, table):
+        return glob.glob(os.path.join(self._rollup_path(table), 'date=*.parquet'))
+
+    def _legacy_rollup_files(self, table):
+        return glob.glob(os.path.join(self._rollup_path(table), 'part-*.parquet'))
+
+    def _rollup_lock(self, table):
+        return file_lock(self._rollup_path(table) + '.lock')
+
+    def _write_file(self, df, path, parts=None):
+        # Se escribe a un temporal oculto y se publica con os.replace: nadie lee un archivo a medio escribir.
+        # En los agregados, la lista de partes va en los metadatos del mismo archivo y se publica junto con
+        # los conteos.
+        temporary = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+        data = self._pyarrow.Table.from_pandas(df, preserve_index=False)
+        if parts is not None:
+            data = data.replace_schema_metadata({**data.schema.metadata,
+                                                 ROLLUP_PARTS_KEY: json.dumps(sorted(parts)).encode()})
+        self._parquet.write_table(data, temporary)
+        if self.fsync:
+            fsync_file(temporary)
+        os.replace(temporary, path)
+
+    def _remove_stale_temporaries(self, table):
+        # Los temporales sin punto son de versiones anteriores y rompían la lectura del directorio
+        now = time.time()
+        for directory in glob.glob(os.path.join(self._table_path(table), 'date=*')) + [self._rollup_path(table)]:
+            for temporary in glob.glob(os.path.join(directory, '*.tmp')) + glob.glob(os.path.join(directory, '.*.tmp')):
+                try:
+                    hidden = os.path.basename(temporary).startswith('.')
+                    if not hidden or now - os.path.getmtime(temporary) > STALE_TEMP_SECONDS:
+                        os.remove(temporary)
+                except FileNotFoundError:
+                    pass
+
+    def _included_parts(self, day_file):
+        # Partes ya sumadas en el archivo de agregados del día; None si no existe o es de una versión anterior
+        if not os.path.exists(day_file):
+            return None
+        parts = (self._parquet.read_schema(day_file).metadata or {}).get(ROLLUP_PARTS_KEY)
+        return set(json.loads(parts)) if parts is not None else None
+
+    def _merge_rollup_day(self, table, day, rollup, parts):
+        # Suma los agregados de nuevas partes al archivo del día; se llama con el lock tomado
+        day_file = self._rollup_day_file(table, day)
+        included = self._included_parts(day_file) or set()
+        if os.path.exists(day_file):
+            rollup = merge_rollups(pd.concat([pd.read_parquet(day_file), rollup], ignore_index=True))
+        self._write_file(rollup, day_file, included | set(parts))
+
+    def _read_journal(self, partition):
+        try:
+            with open(os.path.join(partition, COMPACTION_JOURNAL), 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            return {'parts': journal['parts'], 'into': journal['into']}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _finish_compaction(self, table, day):
+        # Termina una compactación interrumpida o cuyas partes no se pudieron borrar; con el lock tomado
+        partition = self._partition_path(table, day)
+        journal_path = os.path.join(partition, COMPACTION_JOURNAL)
+        if not os.path.exists(journal_path):
+            return True
+        journal = self._read_journal(partition)
+        if journal is None or not os.path.exists(os.path.join(partition, journal['into'])):
+            # Murió antes de publicar el archivo compactado: las partes originales siguen siendo los datos
+            os.remove(journal_path)
+            return True
+        day_file = self._rollup_day_file(table, day)
+        included = self._included_parts(day_file)
+        if included is not None and journal['into'] not in included:
+            # Los conteos no cambian, solo qué partes los forman
+            self._write_file(pd.read_parquet(day_file), day_file,
+                             (included - set(journal['parts'])) | {journal['into']})
+        pending = False
+        for name in journal['parts']:
+            try:
+                os.remove(os.path.join(partition, name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # En Windows no se puede borrar un archivo que un lector tiene abierto; se reintenta después
+                pending = True
+        if not pending:
+            os.remove(journal_path)
+        return not pending
+
+    def _compact_day(self, table, day):
+        # Cada lote agrega una parte; al acumularse se combinan en una, así listar y leer un día no crece con
+        # la cantidad de lotes. Solo entran las partes que los agregados ya suman; con el lock tomado.
+        if not self._finish_compaction(table, day):
+            return
+        partition = self._partition_path(table, day)
+        included = self._included_parts(self._rollup_day_file(table, day)) or set()
+        names = sorted(name for name in map(os.path.basename, glob.glob(os.path.join(partition, '*.parquet')))
+                       if name in included)
+        if len(names) < PARQUET_COMPACT_PARTS:
+            return
+        into = f'part-{uuid.uuid4().hex}.parquet'
+        with open(os.path.join(partition, COMPACTION_JOURNAL), 'w', encoding='utf-8') as f:
+            json.dump({'parts': names, 'into': into}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._write_file(self._read_parts(os.path.join(partition, name) for name in names),
+                         os.path.join(partition, into))
+        self._finish_compaction(table, day)
+
+    def _sync_rollup(self, table):
+        # Al abrir: termina las compactaciones pendientes, suma las partes que quedaron fuera de los agregados
+        # (un proceso murió entre escribir la parte y sumarla) y recalcula los días sin lista de partes
+        # (formato anterior) o con partes que ya no existen. Cada parte se cuenta exactamente una vez.
+        with self._rollup_lock(table):
+            for legacy in self._legacy_rollup_files(table):
+                os.remove(legacy)
+            for journal_path in glob.glob(os.path.join(self._table_path(table), 'date=*', COMPACTION_JOURNAL)):
+                self._finish_compaction(table, os.path.basename(os.path.dirname(journal_path))[len('date='):])
+            days = {}
+            for part in self._part_files(table):
+                days.setdefault(os.path.basename(os.path.dirname(part))[len('date='):], {})[
+                    os.path.basename(part)] = part
+            for day_file in self._rollup_files(table):
+                if os.path.basename(day_file)[len('date='):-len('.parquet')] not in days:
+                    os.remove(day_file)
+            for day, parts in days.items():
+                day_file = self._rollup_day_file(table, day)
+                included = self._included_parts(day_file)
+                if included is None or not included <= parts.keys():
+                    self._write_file(rollup_frame(self._read_parts(parts.values())), day_file, parts.keys())
+                    continue
+                missing = parts.keys() - included
+                if missing:
+                    self._merge_rollup_day(table, day, rollup_frame(self._read_parts(parts[name] for name in missing)),
+                                           missing)
+            self._write_count(table, int(self.read_rollup(table)['count'].sum()))
+
+    def count(self, table):
+        # Se guarda junto a las tablas y se actualiza con el lock de cada lote, como en CsvStore; al abrir se
+        # recalcula desde los agregados
+        try:
+            with open(self._meta_path(table), 'r', encoding='utf-8') as f:
+                return json.load(f)['row_count']
+        except (OSError, ValueError, KeyError):
+            return int(self.read_rollup(table)['count'].sum())
+
+    def append_frame(self, table, df):
+        # Un archivo nuevo por lote y por día: escribir nunca reescribe datos existentes. Sus agregados se
+        # suman al archivo del día bajo el mismo lock, así una reconstrucción nunca ve una parte a medio sumar.
+        with self._rollup_lock(table):
+            row_count = self.count(table)
+            for day, rows in df.groupby(df['timestamp'].dt.strftime('%Y-%m-%d')):
+                partition = self._partition_path(table, day)
+                os.makedirs(partition, exist_ok=True)
+                part_name = f'part-{uuid.uuid4().hex}.parquet'
+                self._write_file(rows, os.path.join(partition, part_name))
+                self._merge_rollup_day(table, day, rollup_frame(rows), [part_name])
+                self._compact_day(table, day)
+            self._write_count(table, row_count + len(df))
+
+    def read(self, table, columns=None):
+        # Solo los archivos de partes publicados, nunca lo que haya además en el directorio
+        return self.read_range(table, columns=columns)
+
+    def read_range(self, table, start=None, end=None, columns=None):
+        # Las particiones date=AAAA-MM-DD fuera del rango no se abren
+        columns = columns or FIELDNAMES
+        first_day = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+        last_day = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+        parts = []
+        for part in self._part_files(table):
+            day = os.path.basename(os.path.dirname(part))[len('date='):]
+            if (first_day is None or day >= first_day) and (last_day is None or day <= last_day):
+                parts.append(part)
+        try:
+            df = self._read_parts(parts, columns)
+        except FileNotFoundError:
+            # Una compactación borró partes entre listarlas y leerlas: sus filas ya están en el archivo combinado
+            return self.read_range(table, start, end, columns)
+        return df[_range_mask(df['timestamp'], start, end)].reset_index(drop=True)
+
+    def _read_parts(self, parts, columns=None):
+        columns = columns or FIELDNAMES
+        frames = [pd.read_parquet(part, columns=columns) for part in parts]
+        if not frames:
+            return empty_frame(columns)
+        return pd.concat(frames, ignore_index=True).astype({name: COLUMN_DTYPES[name] for name in columns})
+
+    def read_rollup(self, table):
+        # Un archivo ya combinado por día
+        parts = sorted(self._rollup_files(table))
+        if not parts:
+            return rollup_frame(empty_frame())
+        rollup = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+        return rollup.astype(ROLLUP_DTYPES)[ROLLUP_COLUMNS]
+
+
+STORE_BACKENDS = {
+    'csv': CsvStore,
+    'sqlite': SqliteStore,
+    'parquet': ParquetStore
+}
+
+
+def open_store(backend=DEFAULT_BACKEND, path=None, fsync=False):
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Backend de almacenamiento no válido: {backend}")
+    return STORE_BACKENDS[backend](path or DEFAULT_PATHS[backend], fsync=fsync)
+
+
+def save_detections(store, detections_data, location=None):
+    store.append(TABLE_DETECTIONS, detections_data, location)
+    cars_only = [d for d in detections_data if d['object_class'] == 'car']
+    store.append(TABLE_CARS, cars_only, location)
+    return cars_only
+
+
+def read_legacy_csv(csv_filename):
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        header = reader.fieldnames or []
+        for row in reader:
+            # Filas escritas con ubicación bajo un encabezado antiguo sin esas columnas
+            extra = row.pop(None, None)
+            if extra and 'location_lat' not in header and len(extra) == 2:
+                row['location_lat'], row['location_lng'] = extra
+            yield {name: (row.get(name) or None) for name in FIELDNAMES}
+
+
+def migrate_csv(store, csv_filename, table, chunk_size=50000):
+    imported = 0
+    chunk = []
+    for row in read_legacy_csv(csv_filename):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            imported += store.append(table, chunk)
+            chunk = []
+    if chunk:
+        imported += store.append(table, chunk)
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa los CSV de detecciones existentes al almacén configurado')
+    parser.add_argument('--backend', choices=sorted(STORE_BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--path', default=None)
+    parser.add_argument('--source-dir', default='.')
+    parser.add_argument('--force', action='store_true', help='Importar aunque la tabla ya tenga datos')
+    args = parser.parse_args()
+
+    if args.backend == 'csv':
+        parser.error('El backend csv ya usa los archivos originales')
+
+    store = open_store(args.backend, args.path)
+    for table in TABLES:
+        csv_filename = os.path.join(args.source_dir, f'{table}.csv')
+        if not os.path.exists(csv_filename):
+            print(f"No se encontró {csv_filename}, se omite")
+            continue
+        existing = store.count(table)
+        if existing and not args.force:
+            print(f"La tabla {table} ya tiene {existing} filas, se omite (use --force para importar igual)")
+            continue
+        imported = migrate_csv(store, csv_filename, table)
+        print(f"✓ {imported} filas importadas de {csv_filename} a {table} (total: {store.count(table)})")
+
+
+if __name__ == '__main__':
+    main()
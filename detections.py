@@ -0,0 +1,182 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from detection_store import TIMESTAMP_FORMAT
+
+# Cajas de un frame en píxeles del video original, extraídas del resultado de una sola vez
+BOX_DTYPE = np.dtype([
+    ('x1', 'f4'), ('y1', 'f4'), ('x2', 'f4'), ('y2', 'f4'),
+    ('confidence', 'f4'), ('class_id', 'i4')
+])
+
+# Detecciones registradas de un análisis; se convierten a filas del almacén solo al final
+RECORD_DTYPE = np.dtype(BOX_DTYPE.descr + [
+    ('frame_number', 'i8'), ('time_seconds', 'f8'), ('timestamp', 'f8')
+])
+
+
+def empty_boxes():
+    return np.empty(0, dtype=BOX_DTYPE)
+
+
+def parse_boxes(result, offset=0, frame_scale=1.0):
+    # Una copia al CPU por frame en lugar de tres por caja
+    boxes = result.boxes if result is not None else None
+    if boxes is None or len(boxes) == 0:
+        return empty_boxes()
+    xyxy = (boxes.xyxy.cpu().numpy() + offset) * frame_scale
+    parsed = np.empty(len(xyxy), dtype=BOX_DTYPE)
+    parsed['x1'], parsed['y1'], parsed['x2'], parsed['y2'] = xyxy.T
+    parsed['confidence'] = boxes.conf.cpu().numpy()
+    parsed['class_id'] = boxes.cls.cpu().numpy()
+    return parsed
+
+
+def box_coordinates(boxes):
+    return np.stack([boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2']], axis=1)
+
+
+def box_centers(boxes):
+    return np.stack([(boxes['x1'] + boxes['x2']) / 2, (boxes['y1'] + boxes['y2']) / 2], axis=1)
+
+
+def empty_records():
+    return np.empty(0, dtype=RECORD_DTYPE)
+
+
+def make_records(boxes, frame_number, time_seconds, timestamp=None):
+    records = np.empty(len(boxes), dtype=RECORD_DTYPE)
+    for name in BOX_DTYPE.names:
+        records[name] = boxes[name]
+    records['frame_number'] = frame_number
+    records['time_seconds'] = time_seconds
+    records['timestamp'] = time.time() if timestamp is None else timestamp
+    return records
+
+
+class DetectionLog:
+    def __init__(self, keep_records=True):
+        # Con persistencia incremental solo se llevan los conteos; las filas las guarda el escritor
+        self.keep_records = keep_records
+        self._chunks = []
+        self.class_counts = {}
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def add(self, boxes, frame_number, time_seconds, timestamp=None):
+        if not len(boxes):
+            return empty_records()
+        records = make_records(boxes, frame_number, time_seconds, timestamp)
+        if self.keep_records:
+            self._chunks.append(records)
+
+        class_ids, counts = np.unique(boxes['class_id'], return_counts=True)
+        for class_id, count in zip(class_ids.tolist(), counts.tolist()):
+            self.class_counts[class_id] = self.class_counts.get(class_id, 0) + count
+        return records
+
+    def summary(self, names):
+        return {names[class_id]: count for class_id, count in self.class_counts.items()}
+
+    def records(self):
+        if not self._chunks:
+            return empty_records()
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+
+class DetectionStats:
+    # Resumen acumulado de las detecciones guardadas, en memoria constante sin importar la duración del video
+    def __init__(self, car_class_id=None):
+        self.car_class_id = car_class_id
+        self.count = 0
+        self.class_counts = {}
+        self.class_confidence = {}
+        self.confidence_min = self.confidence_max = None
+        self.confidence_sum = 0.0
+        self.first = self.last = None
+        self.cars = None
+        if car_class_id is not None:
+            self.cars = {'count': 0, 'confidence_min': None, 'confidence_max': None, 'confidence_sum': 0.0,
+                         'frames': 0, 'max_frame': None, 'first_time': None, 'last_time': None}
+
+    def update(self, records):
+        if not len(records):
+            return
+        confidence = np.round(records['confidence'].astype(np.float64), 3)
+        self.count += len(records)
+        for class_id in np.unique(records['class_id']).tolist():
+            mask = records['class_id'] == class_id
+            self.class_counts[class_id] = self.class_counts.get(class_id, 0) + int(mask.sum())
+            self.class_confidence[class_id] = self.class_confidence.get(class_id, 0.0) + float(confidence[mask].sum())
+        self.confidence_min = _merge_extreme(min, self.confidence_min, float(confidence.min()))
+        self.confidence_max = _merge_extreme(max, self.confidence_max, float(confidence.max()))
+        self.confidence_sum += float(confidence.sum())
+        first = (int(records['frame_number'][0]), round(float(records['time_seconds'][0]), 2))
+        self.first = self.first or first
+        self.last = (int(records['frame_number'][-1]), round(float(records['time_seconds'][-1]), 2))
+
+        if self.cars is None:
+            return
+        mask = records['class_id'] == self.car_class_id
+        if not mask.any():
+            return
+        cars = self.cars
+        car_confidence = confidence[mask]
+        cars['count'] += int(mask.sum())
+        cars['confidence_min'] = _merge_extreme(min, cars['confidence_min'], float(car_confidence.min()))
+        cars['confidence_max'] = _merge_extreme(max, cars['confidence_max'], float(car_confidence.max()))
+        cars['confidence_sum'] += float(car_confidence.sum())
+        # Los lotes llegan en orden de frame, así que un frame nunca queda repartido en dos lotes
+        frames, counts = np.unique(records['frame_number'][mask], return_counts=True)
+        cars['frames'] += len(frames)
+        busiest = int(np.argmax(counts))
+        if cars['max_frame'] is None or counts[busiest] > cars['max_frame'][1]:
+            cars['max_frame'] = (int(frames[busiest]), int(counts[busiest]))
+        times = records['time_seconds'][mask]
+        if cars['first_time'] is None:
+            cars['first_time'] = round(float(times[0]), 2)
+        cars['last_time'] = round(float(times[-1]), 2)
+
+
+def _merge_extreme(function, current, value):
+    return value if current is None else function(current, value)
+
+
+def _rounded(values, decimals):
+    return np.round(values.astype(np.float64), decimals).tolist()
+
+
+def records_to_dicts(records, names):
+    # Filas del almacén con el mismo formato y redondeo de siempre, calculadas por columna
+    if not len(records):
+        return []
+    width = records['x2'] - records['x1']
+    height = records['y2'] - records['y1']
+    formatted = {}
+    timestamps = []
+    for value in records['timestamp'].astype(np.int64).tolist():
+        if value not in formatted:
+            formatted[value] = datetime.fromtimestamp(value).strftime(TIMESTAMP_FORMAT)
+        timestamps.append(formatted[value])
+
+    columns = {
+        'timestamp': timestamps,
+        'frame_number': records['frame_number'].tolist(),
+        'time_seconds': _rounded(records['time_seconds'], 2),
+        'object_class': [names[class_id] for class_id in records['class_id'].tolist()],
+        'confidence': _rounded(records['confidence'], 3),
+        'bbox_x1': _rounded(records['x1'], 1),
+        'bbox_y1': _rounded(records['y1'], 1),
+        'bbox_x2': _rounded(records['x2'], 1),
+        'bbox_y2': _rounded(records['y2'], 1),
+        'bbox_width': _rounded(width, 1),
+        'bbox_height': _rounded(height, 1),
+        'bbox_center_x': _rounded(records['x1'] + width / 2, 1),
+        'bbox_center_y': _rounded(records['y1'] + height / 2, 1)
+    }
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
@@ -0,0 +1,131 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+
+
+def _run_job(job_id, progress, fn, args, kwargs):
+    def report(frames_processed, total_frames, gauges=None):
+        progress[job_id] = {'frames_processed': frames_processed, 'total_frames': total_frames,
+                            'gauges': gauges or {}}
+
+    report(0, 0)
+    return fn(*args, progress_callback=report, **kwargs)
+
+
+class JobManager:
+    def __init__(self, max_workers=2, max_finished_jobs=500, initializer=None, initargs=(), on_finish=None):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_finish = on_finish
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._progress = None
+
+    def _ensure_started(self):
+        # Los procesos se crean al enviar el primer trabajo, no al importar el módulo
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._manager = context.Manager()
+            self._progress = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=self.initializer, initargs=self.initargs)
+
+    def start(self):
+        with self._lock:
+            self._ensure_started()
+            # Fuerza el arranque de los workers (y su inicializador) antes del primer trabajo
+            self._executor.submit(int)
+
+    def submit(self, fn, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._ensure_started()
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': JOB_QUEUED,
+                'submitted_at': time.time(),
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            future = self._executor.submit(_run_job, job_id, self._progress, fn, args, kwargs)
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id, future):
+        try:
+            result = future.result()
+            error = result.get('error') if isinstance(result, dict) else None
+        except Exception as e:
+            result, error = None, str(e)
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            finished = dict(job, status=JOB_ERROR if error else JOB_DONE, result=result, error=error,
+                            finished_at=time.time())
+
+        # Las métricas se registran antes de publicar el estado: quien vea el trabajo terminado ya lo
+        # encuentra contado en /metrics
+        try:
+            if self.on_finish is not None:
+                self.on_finish(finished)
+        finally:
+            with self._lock:
+                job.update(status=finished['status'], result=finished['result'], error=finished['error'],
+                           finished_at=finished['finished_at'])
+                self._evict_finished()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished_at'] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+            self._progress.pop(job_id, None)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        progress = self._progress.get(job_id) if self._progress is not None else None
+        if progress is not None and job['status'] == JOB_QUEUED:
+            job['status'] = JOB_RUNNING
+
+        frames_processed = progress['frames_processed'] if progress else 0
+        total_frames = progress['total_frames'] if progress else 0
+        if job['status'] == JOB_DONE:
+            frames_processed = total_frames = job['result'].get('total_frames', total_frames)
+
+        job['frames_processed'] = frames_processed
+        job['total_frames'] = total_frames
+        job['progress'] = round(frames_processed / total_frames * 100, 1) if total_frames else 0.0
+        return job
+
+    def jobs_in_flight(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['finished_at'] is None)
+
+    def running_gauges(self):
+        # Suma los indicadores que reportan los trabajos en curso (colas, tracks activos)
+        with self._lock:
+            running = [job_id for job_id, job in self._jobs.items() if job['finished_at'] is None]
+        totals = {}
+        for job_id in running:
+            progress = self._progress.get(job_id) if self._progress is not None else None
+            for key, value in (progress or {}).get('gauges', {}).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
@@ -0,0 +1,272 @@
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from batch_ingest import parse_location
+from detection_store import DEFAULT_BACKEND, STORE_BACKENDS, open_store
+from detections import DetectionLog, box_centers, box_coordinates, parse_boxes
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, INFERENCE_BACKENDS, get_model
+from regions import CameraRegions, LineCounter
+from streaming import StreamingWriter
+from tracker import CentroidTracker
+from video_analysis import TRACKER_MAX_DISAPPEARED, TRACKER_MAX_DISTANCE
+
+# Intervalo de los conteos que se guardan y se informan
+COUNT_INTERVAL_SECONDS = 60
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+# Espera máxima por un frame antes de revisar si cerró el minuto
+READ_TIMEOUT = 1.0
+# Límites del decodificador: un stream colgado devuelve error y pasa por la reconexión en lugar de bloquear
+STREAM_OPEN_TIMEOUT_MS = 10000
+STREAM_READ_TIMEOUT_MS = 5000
+
+
+def parse_source(source):
+    # Un número es un dispositivo local (/dev/videoN); lo demás, una URL o un archivo
+    return int(source) if source.isdigit() else source
+
+
+class LatestFrameReader:
+    # Lee el stream en un hilo propio y conserva solo el último frame: si la inferencia se atrasa, los frames
+    # intermedios se descartan en lugar de acumularse, así la latencia queda acotada a un frame en espera.
+    # Ante un corte se reconecta con espera creciente; un archivo local se reproduce al ritmo de sus FPS y
+    # termina al llegar al final.
+    def __init__(self, source, realtime=None, reconnect_delay=RECONNECT_DELAY,
+                 max_reconnect_delay=MAX_RECONNECT_DELAY):
+        self.source = parse_source(source)
+        self.is_file = isinstance(self.source, str) and os.path.exists(self.source)
+        self.realtime = self.is_file if realtime is None else realtime
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.finished = False
+        self._latest = None
+        self._stopped = threading.Event()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='lector-stream', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def read(self, timeout=READ_TIMEOUT):
+        # (frame, número de frame, momento de captura), o None si no llegó nada a tiempo
+        with self._condition:
+            if self._latest is None and not self.finished:
+                self._condition.wait(timeout)
+            latest, self._latest = self._latest, None
+            return latest
+
+    def _open(self):
+        if self.is_file:
+            return cv2.VideoCapture(self.source)
+        cap = cv2.VideoCapture(self.source, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, STREAM_OPEN_TIMEOUT_MS,
+                                                          cv2.CAP_PROP_READ_TIMEOUT_MSEC, STREAM_READ_TIMEOUT_MS])
+        # Sin cola en el propio decodificador: el frame entregado es el más reciente
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stopped.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                cap.release()
+                if self.is_file:
+                    break
+                print(f"No se pudo conectar a {self.source}; reintento en {delay:.0f}s")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            delay = self.reconnect_delay
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            started = time.monotonic()
+            replayed = 0
+            while not self._stopped.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if self.realtime:
+                    # Reproducción de un archivo como si fuera una cámara en vivo
+                    replayed += 1
+                    self._stopped.wait(max(0.0, started + replayed / fps - time.monotonic()))
+                self.frames_read += 1
+                with self._condition:
+                    if self._latest is not None:
+                        self.frames_dropped += 1
+                    self._latest = (frame, self.frames_read, time.time())
+                    self._condition.notify()
+            cap.release()
+
+            if self.is_file:
+                break
+            if not self._stopped.is_set():
+                self.reconnects += 1
+                print(f"Stream interrumpido; reconectando a {self.source} (reconexión {self.reconnects})")
+        with self._condition:
+            self.finished = True
+            self._condition.notify()
+
+
+class IntervalCounts:
+    # Acumula los objetos nuevos de cada minuto y los guarda juntos al cerrar el intervalo. Se guardan las filas
+    # de detección (no solo los totales) para que los agregados, el mapa de calor y las series salgan del mismo
+    # almacén que los videos subidos; los conteos por minuto son /api/timeseries con bucket=1m
+    def __init__(self, writer, names, interval_seconds=COUNT_INTERVAL_SECONDS):
+        self.writer = writer
+        self.names = names
+        self.interval_seconds = interval_seconds
+        self.interval = None
+        self._chunks = []
+        self._dropped = 0
+        self.frames = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def add(self, records, latency):
+        self.frames += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        if len(records):
+            self._chunks.append(records)
+
+    def roll(self, now, reader, force=False):
+        interval = int(now // self.interval_seconds)
+        if self.interval is None:
+            self.interval = interval
+        if interval == self.interval and not force:
+            return
+        if force and not self.frames:
+            # Al detener la ingesta sin frames nuevos no hay intervalo que informar
+            return
+        records = np.concatenate(self._chunks) if self._chunks else None
+        counts = {}
+        if records is not None:
+            self.writer.add(records)
+            class_ids, class_counts = np.unique(records['class_id'], return_counts=True)
+            counts = {self.names[class_id]: count for class_id, count in zip(class_ids.tolist(), class_counts.tolist())}
+
+        started = datetime.fromtimestamp(self.interval * self.interval_seconds)
+        latency = self.latency_sum / self.frames if self.frames else 0.0
+        summary = ', '.join(f"{name}: {count}" for name, count in sorted(counts.items())) or 'sin objetos'
+        print(f"[{started:%Y-%m-%d %H:%M:%S}] {summary} | {self.frames} frames analizados, "
+              f"{reader.frames_dropped - self._dropped} descartados, latencia media {latency:.2f}s "
+              f"(máx. {self.latency_max:.2f}s)")
+        self.interval = interval
+        self._dropped = reader.frames_dropped
+        self._chunks = []
+        self.frames = 0
+        self.latency_sum = self.latency_max = 0.0
+
+
+def run_live(source, store, location=None, regions=None, confidence_threshold=0.5, model_name=DEFAULT_MODEL,
+             inference_backend=DEFAULT_INFERENCE_BACKEND, realtime=None, duration=None,
+             interval_seconds=COUNT_INTERVAL_SECONDS):
+    model = get_model(model_name, inference_backend)
+    if isinstance(regions, (dict, str)):
+        regions = CameraRegions.from_config(regions)
+    # El tracker vive fuera del lector: una reconexión no reinicia los tracks ni los conteos por línea
+    tracker = CentroidTracker(max_distance_threshold=TRACKER_MAX_DISTANCE,
+                              max_frames_disappeared=TRACKER_MAX_DISAPPEARED)
+    line_counter = LineCounter(regions.lines) if regions is not None and regions.lines else None
+    offset = regions.offset if regions is not None else 0
+    detection_log = DetectionLog(keep_records=False)
+
+    # Cada minuto cerrado se escribe en una sola operación
+    writer = StreamingWriter(store, model.names, location=location, flush_rows=1)
+    counts = IntervalCounts(writer, model.names, interval_seconds)
+    reader = LatestFrameReader(source, realtime=realtime).start()
+    started = time.time()
+    processed = 0
+    print(f"Analizando en vivo {source} ({inference_backend}); Ctrl+C para detener")
+    try:
+        while duration is None or time.time() - started < duration:
+            latest = reader.read()
+            if latest is None:
+                if reader.finished:
+                    break
+                counts.roll(time.time(), reader)
+                continue
+
+            frame, frame_number, captured_at = latest
+            crop = regions.crop(frame) if regions is not None else frame
+            result = model.predict(crop, conf=confidence_threshold)[0]
+            boxes = parse_boxes(result, offset)
+            centers = box_centers(boxes)
+            if regions is not None and len(boxes):
+                inside = regions.contains(centers)
+                boxes, centers = boxes[inside], centers[inside]
+
+            # Con frames descartados los objetos avanzan más entre actualizaciones, pero el tracker solo
+            # cuenta frames analizados para decidir cuándo un objeto desapareció
+            processed += 1
+            object_ids, is_new = tracker.update(box_coordinates(boxes), boxes['class_id'], processed)
+            if line_counter is not None:
+                crossed = line_counter.update(object_ids, centers,
+                                              [model.names[class_id] for class_id in boxes['class_id'].tolist()],
+                                              tracker.ids)
+                is_new = np.zeros(len(boxes), dtype=bool)
+                is_new[list(crossed)] = True
+
+            records = detection_log.add(boxes[is_new], frame_number, captured_at - started, captured_at)
+            counts.roll(captured_at, reader)
+            counts.add(records, time.time() - captured_at)
+    except KeyboardInterrupt:
+        print("Ingesta detenida por el usuario")
+    finally:
+        reader.stop()
+        counts.roll(time.time(), reader, force=True)
+        saved = writer.close()
+
+    print(f"Frames leídos: {reader.frames_read}, analizados: {processed}, descartados: {reader.frames_dropped}, "
+          f"reconexiones: {reader.reconnects}")
+    print(f"Detecciones guardadas: {saved}")
+    return {
+        'frames_read': reader.frames_read,
+        'frames_processed': processed,
+        'frames_dropped': reader.frames_dropped,
+        'reconnects': reader.reconnects,
+        'summary': detection_log.summary(model.names),
+        'line_counts': line_counter.counts if line_counter is not None else None,
+        'persisted': saved
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cuenta vehículos en vivo desde un stream RTSP/HTTP o una cámara')
+    parser.add_argument('source', help='URL del stream, número de dispositivo o archivo (se reproduce en tiempo real)')
+    parser.add_argument('--location', default=None, help='Ubicación "lat,lng" de la cámara')
+    parser.add_argument('--regions', default=None, help='JSON de la cámara con ROI y líneas de conteo')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--inference-backend', choices=list(INFERENCE_BACKENDS), default=DEFAULT_INFERENCE_BACKEND)
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--realtime', action=argparse.BooleanOptionalAction, default=None,
+                        help='Leer al ritmo de los FPS del video (por defecto solo con archivos locales)')
+    parser.add_argument('--duration', type=float, default=None, help='Segundos de ingesta antes de detenerse')
+    parser.add_argument('--interval', type=int, default=COUNT_INTERVAL_SECONDS,
+                        help='Segundos de cada intervalo de conteo guardado')
+    parser.add_argument('--backend', choices=sorted(STORE_BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--store-path', default=None)
+    args = parser.parse_args()
+
+    run_live(args.source, open_store(args.backend, args.store_path), location=parse_location(args.location),
+             regions=CameraRegions.load(args.regions) if args.regions else None,
+             confidence_threshold=args.confidence, model_name=args.model, inference_backend=args.inference_backend,
+             realtime=args.realtime, duration=args.duration, interval_seconds=args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,161 +1,169 @@
+import argparse
 import cv2
-from ultralytics import YOLO
 import numpy as np
 import os
-import csv
-from datetime import datetime
+import time
+import matplotlib
 import matplotlib.pyplot as plt
 import pandas as pd
 from collections import defaultdict
-from scipy.spatial import distance
+from datetime import datetime
+from capture_time import capture_start_time
+from detections import DetectionLog, DetectionStats, box_centers, box_coordinates, empty_boxes, parse_boxes
+from pipeline import DetectionPipeline, print_stage_stats
+from tracker import CentroidTracker
+from video_io import FrameSampler, add_decode_arguments, decode_options_from_args, open_video
+from detection_store import DEFAULT_BACKEND, STORE_BACKENDS, TABLE_CARS, TABLE_DETECTIONS, open_store
+from metrics import MetricsRegistry, print_stage_latencies
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, INFERENCE_BACKENDS, get_model
+from regions import CameraRegions, LineCounter
+from streaming import (CHECKPOINT_DIR, CHECKPOINT_FRAMES, DEFAULT_FSYNC, FLUSH_ROWS, FSYNC_POLICIES, StreamingWriter,
+                       checkpoint_path, checkpoint_state, load_checkpoint, remove_checkpoint)
+
+DEFAULT_VIDEO_PATH = "1900-151662242_small.mp4"
+DEFAULT_OUTPUT_PATH = "video_procesado_con_detecciones.mp4"
 
-def detect_objects_in_video(video_path, output_path=None, confidence_threshold=0.5):
-    print("Cargando modelo YOLO...")
-    model = YOLO('yolov8n.pt') 
-    cap = cv2.VideoCapture(video_path)
+def detect_objects_in_video(video_path, output_path=None, confidence_threshold=0.5, model_name=DEFAULT_MODEL,
+                            batch_size=1, frame_stride=1, motion_threshold=None, store=None, display=True,
+                            annotate=None, show_chart=None, regions=None, decode_options=None,
+                            inference_backend=DEFAULT_INFERENCE_BACKEND, fsync=DEFAULT_FSYNC, flush_rows=FLUSH_ROWS,
+                            checkpoint_dir=CHECKPOINT_DIR, checkpoint_frames=CHECKPOINT_FRAMES, start_time=None):
+    if annotate is None:
+        annotate = display or bool(output_path)
+    if show_chart is None:
+        show_chart = display
+    
+    print(f"Cargando modelo YOLO ({inference_backend})...")
+    model = get_model(model_name, inference_backend)
+    cap = open_video(video_path, **(decode_options or {}))
     if not cap.isOpened():
         print(f"Error: No se pudo abrir el video {video_path}")
         return
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    # Las detecciones se guardan en píxeles del video original aunque se decodifique a menor resolución
+    frame_scale = getattr(cap, 'frame_scale', 1.0)
+    if regions is not None:
+        regions = regions.with_frame_scale(frame_scale)
+    fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     print(f"Video: {video_path}")
     print(f"Resolución: {width}x{height}")
-    print(f"FPS: {fps}")
+    print(f"FPS: {fps:.2f}")
     print(f"Total de frames: {total_frames}")
     print(f"Duración: {total_frames/fps:.2f} segundos")
+    start_time, time_source = capture_start_time(video_path, start_time)
+    print(f"Inicio de la grabación: {datetime.fromtimestamp(start_time):%Y-%m-%d %H:%M:%S} ({time_source})")
     out = None
     if output_path:
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
     frame_count = 0
-    detections_summary = {}
-    all_detections = []
-    tracked_objects = {}
-    next_object_id = 1
-    max_distance_threshold = 100
-    max_frames_disappeared = 30
+    detection_log = DetectionLog(keep_records=False)
+    tracker = CentroidTracker(max_distance_threshold=100, max_frames_disappeared=30)
+    line_counter = LineCounter(regions.lines) if regions is not None and regions.lines else None
+    offset = regions.offset if regions is not None else 0
+    
+    # Con un checkpoint de una ejecución interrumpida se continúa desde el último lote guardado
+    checkpoint = checkpoint_path(video_path, 0, checkpoint_dir) if checkpoint_dir else None
+    state = load_checkpoint(checkpoint, video_path)
+    persisted_frame = 0
+    if state is not None:
+        frame_count = state['frame']
+        tracker, line_counter = state['tracker'], state['line_counter']
+        detection_log.class_counts = state['class_counts']
+        persisted_frame = state['persisted_frame']
+        start_time = state.get('start_time') or start_time
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+        print(f"Reanudando desde el frame {frame_count} (checkpoint {checkpoint})")
     
     print("\nProcesando video...")
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_count += 1
-        results = model(frame, conf=confidence_threshold, verbose=False)
-        
-        current_frame_detections = []
+    metrics = MetricsRegistry()
+    store = store or open_store(fsync=fsync == 'batch')
+    car_ids = [class_id for class_id, name in model.names.items() if name == 'car']
+    car_class_id = car_ids[0] if car_ids else None
+    stats = DetectionStats(car_class_id=car_class_id)
+    writer = StreamingWriter(store, model.names, checkpoint_path=checkpoint, fsync=fsync, flush_rows=flush_rows,
+                             metrics=metrics, on_flush=stats.update, persisted_frame=persisted_frame)
+    if state is None:
+        writer.checkpoint(checkpoint_state(video_path, 0, None, frame_count, tracker, line_counter,
+                                           detection_log.class_counts, start_time))
+    interrupted = False
+    try:
+        sampler = FrameSampler(frame_stride=frame_stride, motion_threshold=motion_threshold, start_index=frame_count)
+        pipeline = DetectionPipeline(cap, model, confidence_threshold, batch_size=batch_size, writer=out,
+                                     sampler=sampler, metrics=metrics,
+                                     preprocess=regions.crop if regions is not None else None)
+        for frame, result in pipeline.frames():
+            frame_count += 1
         
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = box.conf[0].cpu().numpy()
-                    class_id = int(box.cls[0].cpu().numpy())
-                    class_name = model.names[class_id]
-                    
-                    bbox_width = x2 - x1
-                    bbox_height = y2 - y1
-                    bbox_center_x = x1 + bbox_width / 2
-                    bbox_center_y = y1 + bbox_height / 2
-                    
-                    current_frame_detections.append({
-                        'center': (bbox_center_x, bbox_center_y),
-                        'class': class_name,
-                        'confidence': confidence,
-                        'bbox': (x1, y1, x2, y2),
-                        'width': bbox_width,
-                        'height': bbox_height
-                    })
+            boxes = parse_boxes(result, offset, frame_scale)
+            centers = box_centers(boxes)
         
-        for obj_id in list(tracked_objects.keys()):
-            tracked_objects[obj_id]['frames_disappeared'] += 1
-            if tracked_objects[obj_id]['frames_disappeared'] > max_frames_disappeared:
-                del tracked_objects[obj_id]
+            if regions is not None and len(boxes):
+                inside = regions.contains(centers)
+                boxes, centers = boxes[inside], centers[inside]
         
-        for detection in current_frame_detections:
-            matched_id = None
-            min_distance = float('inf')
-            
-            for obj_id, tracked_obj in tracked_objects.items():
-                if tracked_obj['class'] == detection['class']:
-                    dist = distance.euclidean(detection['center'], tracked_obj['last_center'])
-                    if dist < min_distance and dist < max_distance_threshold:
-                        min_distance = dist
-                        matched_id = obj_id
-            
-            if matched_id is not None:
-                tracked_objects[matched_id]['last_center'] = detection['center']
-                tracked_objects[matched_id]['frames_disappeared'] = 0
-                tracked_objects[matched_id]['last_frame'] = frame_count
-                object_id = matched_id
-            else:
-                object_id = next_object_id
-                tracked_objects[object_id] = {
-                    'class': detection['class'],
-                    'last_center': detection['center'],
-                    'frames_disappeared': 0,
-                    'first_frame': frame_count,
-                    'last_frame': frame_count
-                }
-                next_object_id += 1
-                
-                if detection['class'] not in detections_summary:
-                    detections_summary[detection['class']] = 0
-                detections_summary[detection['class']] += 1
-                
+            # En frames omitidos por el muestreo el tracker conserva su estado
+            new_boxes = empty_boxes()
+            if result is not None:
+                object_ids, is_new = tracker.update(box_coordinates(boxes), boxes['class_id'], frame_count)
+                if line_counter is not None:
+                    crossed = line_counter.update(object_ids, centers,
+                                                  [model.names[class_id] for class_id in boxes['class_id'].tolist()],
+                                                  tracker.ids)
+                    is_new = np.zeros(len(boxes), dtype=bool)
+                    is_new[list(crossed)] = True
+                new_boxes = boxes[is_new]
                 time_seconds = frame_count / fps
-                x1, y1, x2, y2 = detection['bbox']
-                
-                detection_data = {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'frame_number': frame_count,
-                    'time_seconds': round(time_seconds, 2),
-                    'object_class': detection['class'],
-                    'confidence': round(float(detection['confidence']), 3),
-                    'bbox_x1': round(float(x1), 1),
-                    'bbox_y1': round(float(y1), 1),
-                    'bbox_x2': round(float(x2), 1),
-                    'bbox_y2': round(float(y2), 1),
-                    'bbox_width': round(float(detection['width']), 1),
-                    'bbox_height': round(float(detection['height']), 1),
-                    'bbox_center_x': round(float(detection['center'][0]), 1),
-                    'bbox_center_y': round(float(detection['center'][1]), 1)
-                }
-                all_detections.append(detection_data)
-                
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                label = f"{detection['class']}: {detection['confidence']:.2f}"
-                (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                cv2.rectangle(frame, (int(x1), int(y1) - text_height - 10), 
-                            (int(x1) + text_width, int(y1)), (0, 255, 0), -1)
-                cv2.putText(frame, label, (int(x1), int(y1) - 5), 
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+                records = detection_log.add(new_boxes, frame_count, time_seconds, start_time + time_seconds)
+                if frame_count > persisted_frame:
+                    writer.add(records)
+            if frame_count % checkpoint_frames == 0:
+                writer.checkpoint(checkpoint_state(video_path, 0, None, frame_count, tracker, line_counter,
+                                                   detection_log.class_counts, start_time))
         
-        info_text = f"Frame: {frame_count}/{total_frames}"
-        cv2.putText(frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        car_count = detections_summary.get('car', 0)
-        counter_text = f"Autos: {car_count}"
-        cv2.putText(frame, counter_text, (width - 150, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            # Sin ventana ni video de salida nadie ve el frame: se omite todo el dibujo
+            if annotate:
+                annotation_start = time.perf_counter()
+                draw_detections(frame, new_boxes, model.names, frame_count, total_frames,
+                                detection_log.class_counts.get(car_class_id, 0), frame_scale)
+                if regions is not None:
+                    regions.draw(frame)
+                metrics.observe('stage_seconds', time.perf_counter() - annotation_start, stage='annotation')
         
+            # Se muestra antes de entregarlo al escritor: una vez escrito, el decodificador FFmpeg reutiliza el buffer
+            if display:
+                cv2.imshow('Deteccion YOLO', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    print("Procesamiento interrumpido por el usuario")
+                    interrupted = True
+            pipeline.write(frame)
+            if interrupted:
+                break
+            if frame_count % 30 == 0:
+                progress = (frame_count / total_frames) * 100
+                print(f"Progreso: {progress:.1f}% ({frame_count}/{total_frames} frames)")
+    except BaseException:
+        # El hilo del escritor no debe seguir guardando filas ni reescribiendo el checkpoint; al reanudar
+        # se recalcula lo que no llegó a guardarse
+        writer.abort()
+        raise
+    finally:
+        cap.release()
         if out:
-            out.write(frame)
-        if frame_count % 30 == 0:
-            progress = (frame_count / total_frames) * 100
-            print(f"Progreso: {progress:.1f}% ({frame_count}/{total_frames} frames)")
-        cv2.imshow('Deteccion YOLO', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            print("Procesamiento interrumpido por el usuario")
-            break
-    cap.release()
-    if out:
-        out.release()
-    cv2.destroyAllWindows()
+            out.release()
+        if display:
+            cv2.destroyAllWindows()
     print(f"Frames procesados: {frame_count}")
+    persist_start = time.perf_counter()
+    saved = writer.close()
+    if not interrupted:
+        remove_checkpoint(checkpoint)
+    detections_summary = detection_log.summary(model.names)
+    print_stage_stats(pipeline.stage_stats())
+    print_stage_latencies(metrics)
     
     if detections_summary:
         print("\n=== RESUMEN DE DETECCIONES ===")
@@ -165,205 +173,97 @@ def detect_objects_in_video(video_path, output_path=None, confidence_threshold=0
     else:
         print("No se detectaron objetos en el video.")
     
-    if all_detections:
-        csv_filename = "detecciones_completas.csv"
-        cars_csv_filename = "autos_solo.csv"
-        save_detections_to_csv(all_detections, csv_filename)
-        show_csv_summary(all_detections)
-        save_cars_only_csv(all_detections, cars_csv_filename)
-        create_weekly_cars_chart(cars_csv_filename)
+    if line_counter is not None:
+        print("\n=== CONTEO POR LÍNEA ===")
+        for line_name, counts in line_counter.counts.items():
+            print(f"{line_name}: {sum(counts.values())} cruces {counts}")
+    
+    if saved:
+        print(f"\n✓ Almacén actualizado con {saved} nuevas detecciones durante el procesamiento "
+              f"(vaciado final en {time.perf_counter() - persist_start:.2f}s)")
+        print(f"  Total de detecciones en almacén: {store.count(TABLE_DETECTIONS)}")
+        print(f"  Total de autos en almacén: {store.count(TABLE_CARS)}")
+        show_detections_summary(stats, model.names)
+        show_cars_summary(stats)
+        create_weekly_cars_chart(store, show=show_chart)
     else:
-        print("No hay detecciones para guardar en CSV.")
+        print("No hay detecciones para guardar.")
+    if interrupted and checkpoint:
+        print("Checkpoint conservado: la próxima ejecución continúa desde el último lote guardado")
     
     if output_path:
         print(f"\nVideo procesado guardado en: {output_path}")
 
-def save_detections_to_csv(detections_data, csv_filename="detecciones.csv"):
-    print(f"\nGuardando detecciones en CSV: {csv_filename}")
-    fieldnames = [
-        'timestamp',
-        'frame_number', 
-        'time_seconds',
-        'object_class',
-        'confidence',
-        'bbox_x1',
-        'bbox_y1', 
-        'bbox_x2',
-        'bbox_y2',
-        'bbox_width',
-        'bbox_height',
-        'bbox_center_x',
-        'bbox_center_y'
-    ]
+def draw_detections(frame, boxes, names, frame_count, total_frames, car_count, frame_scale=1.0):
+    for box, (x1, y1, x2, y2) in zip(boxes, box_coordinates(boxes) / frame_scale):
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
+        label = f"{names[int(box['class_id'])]}: {box['confidence']:.2f}"
+        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+        cv2.rectangle(frame, (int(x1), int(y1) - text_height - 10), 
+                    (int(x1) + text_width, int(y1)), (0, 255, 0), -1)
+        cv2.putText(frame, label, (int(x1), int(y1) - 5), 
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
     
-    try:
-        # Verificar si el archivo existe para determinar si escribir encabezados
-        file_exists = os.path.exists(csv_filename)
-        
-        with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # Solo escribir encabezados si el archivo no existe o está vacío
-            if not file_exists or os.path.getsize(csv_filename) == 0:
-                writer.writeheader()
-                print(f"  Archivo nuevo creado: {csv_filename}")
-            else:
-                print(f"  Agregando datos al archivo existente: {csv_filename}")
-            
-            for detection in detections_data:
-                writer.writerow(detection)
-        
-        print(f"✓ CSV actualizado exitosamente con {len(detections_data)} nuevas detecciones")
-        with open(csv_filename, 'r', encoding='utf-8') as f:
-            total_lines = sum(1 for line in f) - 1
-        print(f"  Total de detecciones en archivo: {total_lines}")
-        
-    except Exception as e:
-        print(f"✗ Error al guardar CSV: {e}")
+    info_text = f"Frame: {frame_count}/{total_frames}"
+    cv2.putText(frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    
+    counter_text = f"Autos: {car_count}"
+    cv2.putText(frame, counter_text, (frame.shape[1] - 150, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
-def show_csv_summary(detections_data):
-    if not detections_data:
+def show_detections_summary(stats, names):
+    if not stats.count:
         return
     
-    print(f"\n=== RESUMEN DEL ARCHIVO CSV ===")
-    print(f"Total de detecciones guardadas: {len(detections_data)}")
-    
-    class_counts = {}
-    confidence_sum = {}
-    for detection in detections_data:
-        obj_class = detection['object_class']
-        confidence = detection['confidence']
-        
-        if obj_class not in class_counts:
-            class_counts[obj_class] = 0
-            confidence_sum[obj_class] = 0
-        
-        class_counts[obj_class] += 1
-        confidence_sum[obj_class] += confidence
+    print(f"\n=== RESUMEN DE DETECCIONES GUARDADAS ===")
+    print(f"Total de detecciones guardadas: {stats.count}")
     
     print("\nDetecciones por clase:")
-    for class_name, count in sorted(class_counts.items(), key=lambda x: x[1], reverse=True):
-        avg_confidence = confidence_sum[class_name] / count
-        print(f"  {class_name}: {count} detecciones (confianza promedio: {avg_confidence:.3f})")
+    for class_id, count in sorted(stats.class_counts.items(), key=lambda x: x[1], reverse=True):
+        avg_confidence = stats.class_confidence[class_id] / count
+        print(f"  {names[class_id]}: {count} detecciones (confianza promedio: {avg_confidence:.3f})")
     
-    first_frame = detections_data[0]['frame_number']
-    last_frame = detections_data[-1]['frame_number']
-    first_time = detections_data[0]['time_seconds']
-    last_time = detections_data[-1]['time_seconds']
+    first_frame, first_time = stats.first
+    last_frame, last_time = stats.last
     
     print(f"\nRango temporal:")
     print(f"  Frames: {first_frame} - {last_frame}")
     print(f"  Tiempo: {first_time}s - {last_time}s")
     
-    all_confidences = [d['confidence'] for d in detections_data]
-    min_conf = min(all_confidences)
-    max_conf = max(all_confidences)
-    avg_conf = sum(all_confidences) / len(all_confidences)
-    
     print(f"\nEstadísticas de confianza:")
-    print(f"  Mínima: {min_conf:.3f}")
-    print(f"  Máxima: {max_conf:.3f}")
-    print(f"  Promedio: {avg_conf:.3f}")
+    print(f"  Mínima: {stats.confidence_min:.3f}")
+    print(f"  Máxima: {stats.confidence_max:.3f}")
+    print(f"  Promedio: {stats.confidence_sum / stats.count:.3f}")
 
-def save_cars_only_csv(detections_data, csv_filename="autos_solo.csv"):
-    car_detections = [detection for detection in detections_data if detection['object_class'] == 'car']
-    
-    if not car_detections:
-        print("No se encontraron detecciones de autos para guardar.")
-        return
-    
-    print(f"\nFiltrando y guardando solo autos en CSV: {csv_filename}")
-    fieldnames = [
-        'timestamp',
-        'frame_number', 
-        'time_seconds',
-        'object_class',
-        'confidence',
-        'bbox_x1',
-        'bbox_y1', 
-        'bbox_x2',
-        'bbox_y2',
-        'bbox_width',
-        'bbox_height',
-        'bbox_center_x',
-        'bbox_center_y'
-    ]
-    
-    try:
-        # Verificar si el archivo existe para determinar si escribir encabezados
-        file_exists = os.path.exists(csv_filename)
-        
-        with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # Solo escribir encabezados si el archivo no existe o está vacío
-            if not file_exists or os.path.getsize(csv_filename) == 0:
-                writer.writeheader()
-                print(f"  Archivo nuevo de autos creado: {csv_filename}")
-            else:
-                print(f"  Agregando autos al archivo existente: {csv_filename}")
-            
-            for detection in car_detections:
-                writer.writerow(detection)
-        
-        print(f"✓ CSV de autos actualizado exitosamente con {len(car_detections)} nuevas detecciones")
-        
-        with open(csv_filename, 'r', encoding='utf-8') as f:
-            total_lines = sum(1 for line in f) - 1
-        print(f"  Total de autos en archivo: {total_lines}")
-        show_cars_summary(car_detections)
-        
-    except Exception as e:
-        print(f"✗ Error al guardar CSV de autos: {e}")
-
-def show_cars_summary(car_detections):
-    if not car_detections:
+def show_cars_summary(stats):
+    cars = stats.cars
+    if not cars or not cars['count']:
+        print("No se encontraron detecciones de autos.")
         return
     
     print(f"\n=== RESUMEN DE DETECCIONES DE AUTOS ===")
-    print(f"Total de autos detectados: {len(car_detections)}")
-    
-    confidences = [d['confidence'] for d in car_detections]
-    min_conf = min(confidences)
-    max_conf = max(confidences)
-    avg_conf = sum(confidences) / len(confidences)
+    print(f"Total de autos detectados: {cars['count']}")
     
     print(f"\nEstadísticas de confianza (solo autos):")
-    print(f"  Mínima: {min_conf:.3f}")
-    print(f"  Máxima: {max_conf:.3f}")
-    print(f"  Promedio: {avg_conf:.3f}")
-    
-    frames_with_cars = set(d['frame_number'] for d in car_detections)
-    print(f"\nFrames con autos detectados: {len(frames_with_cars)}")
-    avg_cars_per_frame = len(car_detections) / len(frames_with_cars)
-    print(f"Promedio de autos por frame (con autos): {avg_cars_per_frame:.2f}")
-    first_time = car_detections[0]['time_seconds']
-    last_time = car_detections[-1]['time_seconds']
-    print(f"Rango temporal de autos: {first_time}s - {last_time}s")
-    frame_counts = {}
-    for detection in car_detections:
-        frame = detection['frame_number']
-        frame_counts[frame] = frame_counts.get(frame, 0) + 1
+    print(f"  Mínima: {cars['confidence_min']:.3f}")
+    print(f"  Máxima: {cars['confidence_max']:.3f}")
+    print(f"  Promedio: {cars['confidence_sum'] / cars['count']:.3f}")
     
-    max_cars_frame = max(frame_counts.items(), key=lambda x: x[1])
-    print(f"Frame con más autos: Frame {max_cars_frame[0]} ({max_cars_frame[1]} autos)")
+    print(f"\nFrames con autos detectados: {cars['frames']}")
+    print(f"Promedio de autos por frame (con autos): {cars['count'] / cars['frames']:.2f}")
+    print(f"Rango temporal de autos: {cars['first_time']}s - {cars['last_time']}s")
+    max_frame, max_cars = cars['max_frame']
+    print(f"Frame con más autos: Frame {max_frame} ({max_cars} autos)")
 
-def create_weekly_cars_chart(csv_filename="autos_solo.csv"):
-    if not os.path.exists(csv_filename):
-        print(f"No se encontró el archivo {csv_filename}")
+def create_weekly_cars_chart(store, show=False):
+    if store.count(TABLE_CARS) == 0:
+        print("No hay autos registrados en el almacén")
         return
     
     print(f"\nGenerando gráfico de autos por día de la semana...")
     
     try:
-        cars_by_day = defaultdict(int)
-        with open(csv_filename, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                timestamp_str = row['timestamp']
-                timestamp_dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                day_of_week = timestamp_dt.weekday()
-                cars_by_day[day_of_week] += 1
+        timestamps = store.read(TABLE_CARS, columns=['timestamp'])['timestamp']
+        cars_by_day = defaultdict(int, timestamps.dt.weekday.value_counts().to_dict())
         days_names = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
         days = []
         counts = []
@@ -384,7 +284,9 @@ def create_weekly_cars_chart(csv_filename="autos_solo.csv"):
         plt.tight_layout()
         chart_filename = 'autos_por_dia_semana.png'
         plt.savefig(chart_filename, dpi=300, bbox_inches='tight')
-        plt.show()
+        if show:
+            plt.show()
+        plt.close()
         print(f"✓ Gráfico generado y guardado como: {chart_filename}")
         total_cars = sum(counts)
         print(f"\n=== ESTADÍSTICAS POR DÍA ===")
@@ -397,16 +299,69 @@ def create_weekly_cars_chart(csv_filename="autos_solo.csv"):
         print(f"✗ Error al generar gráfico: {e}")
 
 def main():
-    video_path = "1900-151662242_small.mp4"
-    if not os.path.exists(video_path):
-        print(f"Error: El archivo {video_path} no existe en el directorio actual")
+    parser = argparse.ArgumentParser(description='Detecta y cuenta vehículos en un video con YOLO')
+    parser.add_argument('video_path', nargs='?', default=DEFAULT_VIDEO_PATH)
+    parser.add_argument('--output', default=None,
+                        help=f'Video anotado de salida (por defecto {DEFAULT_OUTPUT_PATH}, ninguno con --headless)')
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--inference-backend', choices=list(INFERENCE_BACKENDS), default=DEFAULT_INFERENCE_BACKEND,
+                        help='Runtime de inferencia; onnx y openvino exportan el modelo la primera vez')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--frame-stride', type=int, default=1)
+    parser.add_argument('--motion-threshold', type=float, default=None)
+    parser.add_argument('--backend', choices=sorted(STORE_BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--store-path', default=None)
+    parser.add_argument('--regions', default=None, help='JSON de la cámara con ROI y líneas de conteo')
+    parser.add_argument('--start-time', default=None,
+                        help='Inicio de la grabación "AAAA-MM-DD HH:MM:SS" (por defecto de los metadatos o el nombre)')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=DEFAULT_FSYNC,
+                        help='Sincronización a disco: ninguna, solo checkpoints o también cada lote guardado')
+    parser.add_argument('--flush-rows', type=int, default=FLUSH_ROWS, help='Detecciones por lote guardado')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR,
+                        help='Directorio de checkpoints para reanudar un análisis interrumpido')
+    parser.add_argument('--checkpoint-frames', type=int, default=CHECKPOINT_FRAMES)
+    parser.add_argument('--no-checkpoint', action='store_true', help='No guardar ni reanudar desde checkpoints')
+    add_decode_arguments(parser)
+    parser.add_argument('--display', action=argparse.BooleanOptionalAction, default=None,
+                        help='Mostrar la ventana con las detecciones')
+    parser.add_argument('--annotate', action=argparse.BooleanOptionalAction, default=None,
+                        help='Dibujar las detecciones (por defecto solo si hay ventana o video de salida)')
+    parser.add_argument('--headless', action='store_true',
+                        help='Sin ventana, sin video de salida salvo --output y sin gráficos interactivos')
+    args = parser.parse_args()
+    
+    display = not args.headless if args.display is None else args.display
+    output_path = args.output
+    if output_path is None and not args.headless:
+        output_path = DEFAULT_OUTPUT_PATH
+    if not display:
+        # Backend sin interfaz gráfica: el gráfico semanal solo se guarda en archivo
+        matplotlib.use('Agg')
+    
+    if not os.path.exists(args.video_path):
+        print(f"Error: El archivo {args.video_path} no existe")
         return
-    output_path = "video_procesado_con_detecciones.mp4"
     
     detect_objects_in_video(
-        video_path=video_path,
+        video_path=args.video_path,
         output_path=output_path,
-        confidence_threshold=0.5  
+        confidence_threshold=args.confidence,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        frame_stride=args.frame_stride,
+        motion_threshold=args.motion_threshold,
+        store=open_store(args.backend, args.store_path, fsync=args.fsync == 'batch'),
+        display=display,
+        annotate=args.annotate,
+        regions=CameraRegions.load(args.regions) if args.regions else None,
+        decode_options=decode_options_from_args(args),
+        inference_backend=args.inference_backend,
+        fsync=args.fsync,
+        flush_rows=args.flush_rows,
+        checkpoint_dir=None if args.no_checkpoint else args.checkpoint_dir,
+        checkpoint_frames=args.checkpoint_frames,
+        start_time=args.start_time
     )
 
 if __name__ == "__main__":
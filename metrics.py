@@ -0,0 +1,148 @@
+import bisect
+import threading
+
+METRICS_PREFIX = 'trafico'
+
+# Límites en segundos: desde operaciones por frame hasta la persistencia de un video completo
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_TYPES = {
+    'stage_seconds': ('histogram', 'Tiempo por frame de cada etapa del análisis'),
+    'persist_seconds': ('histogram', 'Tiempo de guardado de las detecciones de un análisis'),
+    'frames_processed_total': ('counter', 'Frames leídos del video'),
+    'frames_inferred_total': ('counter', 'Frames enviados al modelo'),
+    'detections_total': ('counter', 'Objetos nuevos detectados por clase'),
+    'jobs_total': ('counter', 'Trabajos de análisis terminados por estado'),
+    'active_tracks': ('gauge', 'Tracks activos en los análisis en curso'),
+    'queue_depth': ('gauge', 'Elementos en las colas del pipeline de los análisis en curso'),
+    'jobs_in_flight': ('gauge', 'Trabajos en cola o en ejecución'),
+    'stats_cache_requests_total': ('counter', 'Consultas de estadísticas resueltas desde la caché o recalculadas'),
+    'analysis_cache_requests_total': ('counter', 'Análisis de videos resueltos desde la caché de resultados o encolados')
+}
+
+
+def metric_key(name, **labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(DEFAULT_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, count=1):
+        self.counts[bisect.bisect_left(DEFAULT_BUCKETS, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def merge(self, state):
+        for index, count in enumerate(state['counts']):
+            self.counts[index] += count
+        self.sum += state['sum']
+        self.count += state['count']
+
+    def state(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = metric_key(name, **labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[metric_key(name, **labels)] = value
+
+    def observe(self, name, value, count=1, **labels):
+        key = metric_key(name, **labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value, count)
+
+    def snapshot(self):
+        # Estructura simple y serializable para devolverla desde otro proceso
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {key: histogram.state() for key, histogram in self._histograms.items()}
+            }
+
+    def merge(self, snapshot):
+        if not snapshot:
+            return
+        with self._lock:
+            for key, value in snapshot.get('counters', {}).items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            self._gauges.update(snapshot.get('gauges', {}))
+            for key, state in snapshot.get('histograms', {}).items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.merge(state)
+
+    def histogram_summary(self, name):
+        with self._lock:
+            return {labels: (histogram.sum / histogram.count, histogram.count)
+                    for (metric, labels), histogram in self._histograms.items()
+                    if metric == name and histogram.count}
+
+    def render(self, extra=None):
+        with self._lock:
+            counters = dict(self._counters)
+            current_gauges = dict(self._gauges)
+            histograms = {key: histogram.state() for key, histogram in self._histograms.items()}
+
+        series = {}
+        # extra agrega valores que se leen al momento (trabajos en curso, caché), no acumulados aquí
+        for values in (counters, current_gauges, histograms, extra or {}):
+            for (name, labels), value in values.items():
+                series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(series):
+            metric_type, help_text = METRIC_TYPES.get(name, ('untyped', ''))
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            for labels, value in sorted(series[name], key=lambda item: item[0]):
+                if metric_type != 'histogram':
+                    lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(DEFAULT_BUCKETS + ('+Inf',), value['counts']):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(value["sum"])}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def print_stage_latencies(registry):
+    print("\n=== TIEMPO PROMEDIO POR FRAME ===")
+    for labels, (mean, count) in sorted(registry.histogram_summary('stage_seconds').items()):
+        stage = dict(labels).get('stage')
+        print(f"  {stage}: {mean * 1000:.2f} ms ({count} frames)")
@@ -0,0 +1,166 @@
+import importlib.util
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from ultralytics import YOLO
+
+DEFAULT_MODEL = 'yolov8n.pt'
+MAX_LOADED_MODELS = 2
+WARMUP_IMAGE_SIZE = 640
+
+# Backends de inferencia: formato de exportación de ultralytics y opciones; pytorch usa los pesos tal cual.
+# ONNX Runtime y OpenVINO se cargan con el mismo YOLO(), así los resultados mantienen la interfaz de boxes.
+# requires son los módulos para exportar e inferir; si faltan, ultralytics intentaría instalarlos en cada worker
+INFERENCE_BACKENDS = {
+    'pytorch': None,
+    'onnx': {'format': 'onnx', 'suffix': '.onnx', 'requires': ('onnx', 'onnxruntime')},
+    'openvino': {'format': 'openvino', 'suffix': '_openvino_model', 'requires': ('openvino',)},
+    'openvino-int8': {'format': 'openvino', 'suffix': '_int8_openvino_model', 'int8': True,
+                      'requires': ('openvino', 'nncf')}
+}
+DEFAULT_INFERENCE_BACKEND = 'pytorch'
+EXPORT_DIR = 'modelos_exportados'
+EXPORT_IMAGE_SIZE = 640
+# Espera máxima por la exportación que hace otro proceso antes de considerar abandonado su bloqueo
+EXPORT_LOCK_TIMEOUT = 1800
+
+
+def exported_model_path(weights, backend, imgsz=EXPORT_IMAGE_SIZE, export_dir=EXPORT_DIR):
+    # ultralytics reconoce el formato por la extensión o el sufijo del directorio
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(export_dir, f"{stem}_{imgsz}{INFERENCE_BACKENDS[backend]['suffix']}")
+
+
+def _is_current(path, weights):
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(weights) or os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+def _acquire_export_lock(lock_path):
+    while True:
+        try:
+            return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > EXPORT_LOCK_TIMEOUT:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(1)
+
+
+def export_model(weights, backend, imgsz=EXPORT_IMAGE_SIZE, export_dir=EXPORT_DIR):
+    # Se exporta una sola vez por pesos y backend; se vuelve a exportar si los pesos cambian
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Backend de inferencia no válido: {backend}")
+    spec = INFERENCE_BACKENDS[backend]
+    if spec is None:
+        return weights
+    missing = [module for module in spec['requires'] if importlib.util.find_spec(module) is None]
+    if missing:
+        raise ImportError(f"El backend {backend} requiere {', '.join(missing)} (pip install {' '.join(missing)})")
+    path = exported_model_path(weights, backend, imgsz, export_dir)
+    if _is_current(path, weights):
+        return path
+
+    os.makedirs(export_dir, exist_ok=True)
+    # Los workers de análisis arrancan a la vez: solo uno exporta y los demás esperan el resultado
+    lock_path = path + '.lock'
+    lock = _acquire_export_lock(lock_path)
+    try:
+        if _is_current(path, weights):
+            return path
+        print(f"Exportando {weights} a {backend}...")
+        exported = YOLO(weights).export(format=spec['format'], imgsz=imgsz, int8=spec.get('int8', False),
+                                        verbose=False)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        shutil.move(str(exported), path)
+    finally:
+        os.close(lock)
+        os.remove(lock_path)
+    return path
+
+
+class LoadedModel:
+    def __init__(self, weights, backend=DEFAULT_INFERENCE_BACKEND):
+        self.weights = weights
+        self.backend = backend
+        self.path = export_model(weights, backend)
+        self.model = YOLO(self.path, task='detect')
+        self.names = self.model.names
+        # El predictor de ultralytics guarda estado interno, así que las
+        # inferencias sobre la misma instancia se serializan
+        self._lock = threading.Lock()
+
+    def predict(self, source, **kwargs):
+        kwargs.setdefault('verbose', False)
+        with self._lock:
+            return self.model(source, **kwargs)
+
+    def warmup(self):
+        dummy_frame = np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8)
+        self.predict(dummy_frame)
+
+
+class ModelRegistry:
+    def __init__(self, max_models=MAX_LOADED_MODELS):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        model = self._models.get(key)
+        if model is not None:
+            self._models.move_to_end(key)
+        return model
+
+    def get(self, weights=DEFAULT_MODEL, backend=DEFAULT_INFERENCE_BACKEND):
+        key = (weights, backend)
+        with self._lock:
+            model = self._cached(key)
+            if model is not None:
+                return model
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Un solo hilo carga cada archivo de pesos; el resto espera y reutiliza
+        with load_lock:
+            with self._lock:
+                model = self._cached(key)
+                if model is not None:
+                    return model
+
+            model = LoadedModel(weights, backend)
+            model.warmup()
+
+            with self._lock:
+                self._models[key] = model
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+                self._loading.pop(key, None)
+        return model
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._models.keys())
+
+
+_registry = ModelRegistry()
+
+
+def get_model(weights=DEFAULT_MODEL, backend=DEFAULT_INFERENCE_BACKEND):
+    return _registry.get(weights, backend)
+
+
+def warmup_models(weights_list=(DEFAULT_MODEL,), backend=DEFAULT_INFERENCE_BACKEND):
+    for weights in weights_list:
+        get_model(weights, backend)
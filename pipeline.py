@@ -0,0 +1,277 @@
+import queue
+import threading
+import time
+
+from video_io import read_frame_batches
+
+STAGES = ('decode', 'inference', 'tracking', 'write')
+
+_END = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, busy_seconds, wait_seconds=0.0):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += busy_seconds
+            self.wait_seconds += wait_seconds
+
+    def as_dict(self):
+        with self._lock:
+            rate = self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+            return {
+                'items': self.items,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'wait_seconds': round(self.wait_seconds, 3),
+                'items_per_second': round(rate, 1)
+            }
+
+
+class DetectionPipeline:
+    def __init__(self, cap, model, confidence_threshold=0.5, batch_size=1, queue_size=8, writer=None,
+                 sampler=None, metrics=None, preprocess=None):
+        self.cap = cap
+        self.model = model
+        self.confidence_threshold = confidence_threshold
+        self.batch_size = batch_size
+        self.writer = writer
+        self.sampler = sampler
+        self.metrics = metrics
+        # Transformación previa a la inferencia, por ejemplo recortar al ROI de la cámara
+        self.preprocess = preprocess
+        # Los capturadores con buffers reutilizables (FFmpegCapture) reciben de vuelta cada frame ya usado
+        self._recycle = getattr(cap, 'recycle', None)
+
+        # Las colas acotadas dan contrapresión: una etapa lenta frena a la anterior
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size * max(1, batch_size))
+        self.write_queue = queue.Queue(maxsize=queue_size) if writer is not None else None
+
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self._stop = threading.Event()
+        self._threads = []
+        self._error = None
+        self._write_wait = 0.0
+        self._started_at = None
+        self._wall_seconds = 0.0
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _observe(self, stage, seconds, count=1):
+        if self.metrics is not None and count:
+            self.metrics.observe('stage_seconds', seconds / count, count=count, stage=stage)
+
+    def _observe_inference(self, results, seconds):
+        # Ultralytics informa por imagen el tiempo de preproceso, inferencia y postproceso en ms
+        speeds = [getattr(result, 'speed', None) for result in results]
+        if self.metrics is None or not all(speeds):
+            self._observe('inference', seconds, len(results))
+            return
+        for speed in speeds:
+            for stage in ('preprocess', 'inference', 'postprocess'):
+                if speed.get(stage) is not None:
+                    self.metrics.observe('stage_seconds', speed[stage] / 1000, stage=stage)
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _decode(self):
+        stats = self.stats['decode']
+        try:
+            batches = read_frame_batches(self.cap, self.batch_size, self.sampler)
+            while True:
+                start = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                decoded = time.perf_counter()
+                self._observe('decode', decoded - start, len(batch))
+                if not self._put(self.decode_queue, batch):
+                    break
+                stats.record(len(batch), decoded - start, time.perf_counter() - decoded)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self.decode_queue, _END)
+
+    def _infer(self):
+        stats = self.stats['inference']
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = self._get(self.decode_queue)
+                if batch is _END:
+                    break
+                received = time.perf_counter()
+                frames = [frame for frame, run_inference in batch if run_inference]
+                if self.preprocess is not None:
+                    frames = [self.preprocess(frame) for frame in frames]
+                predictions = self.model.predict(frames, conf=self.confidence_threshold) if frames else []
+                inferred = time.perf_counter()
+                if predictions:
+                    self._observe_inference(predictions, inferred - received)
+                results = iter(predictions)
+                # Los frames omitidos siguen su curso con resultado None para conservar el orden
+                for frame, run_inference in batch:
+                    result = next(results) if run_inference else None
+                    if not self._put(self.result_queue, (frame, result)):
+                        return
+                stats.record(len(frames), inferred - received,
+                             (received - start) + (time.perf_counter() - inferred))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self.result_queue, _END)
+
+    def _write(self):
+        stats = self.stats['write']
+        try:
+            while True:
+                start = time.perf_counter()
+                frame = self._get(self.write_queue)
+                if frame is _END:
+                    break
+                received = time.perf_counter()
+                self.writer.write(frame)
+                if self._recycle is not None:
+                    self._recycle(frame)
+                written = time.perf_counter()
+                self._observe('write', written - received)
+                stats.record(1, written - received, received - start)
+        except Exception as e:
+            self._fail(e)
+
+    def _start(self):
+        self._started_at = time.perf_counter()
+        targets = [self._decode, self._infer]
+        if self.write_queue is not None:
+            targets.append(self._write)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _finish(self, completed):
+        if not completed:
+            self._stop.set()
+        if self.write_queue is not None:
+            self._put(self.write_queue, _END)
+        for thread in self._threads:
+            thread.join()
+        self._stop.set()
+        self._wall_seconds = time.perf_counter() - self._started_at
+
+    def frames(self):
+        self._start()
+        tracking = self.stats['tracking']
+        completed = False
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(self.result_queue)
+                if item is _END:
+                    completed = True
+                    break
+                received = time.perf_counter()
+                self._write_wait = 0.0
+                yield item
+                if self._recycle is not None and self.write_queue is None:
+                    self._recycle(item[0])
+                busy = time.perf_counter() - received - self._write_wait
+                self._observe('tracking', busy)
+                tracking.record(1, busy, (received - start) + self._write_wait)
+        finally:
+            self._finish(completed)
+        if self._error is not None:
+            raise self._error
+
+    def write(self, frame):
+        if self.write_queue is None:
+            return
+        start = time.perf_counter()
+        self._put(self.write_queue, frame)
+        self._write_wait += time.perf_counter() - start
+
+    def queue_depths(self):
+        depths = {
+            'decode': self.decode_queue.qsize(),
+            'inference': self.result_queue.qsize()
+        }
+        if self.write_queue is not None:
+            depths['write'] = self.write_queue.qsize()
+        return depths
+
+    def stage_stats(self):
+        summary = {name: stats.as_dict() for name, stats in self.stats.items()
+                   if name != 'write' or self.write_queue is not None}
+        frames = self.stats['tracking'].items
+        summary['total'] = {
+            'frames': frames,
+            'inferred_frames': self.stats['inference'].items,
+            'wall_seconds': round(self._wall_seconds, 3),
+            'fps': round(frames / self._wall_seconds, 1) if self._wall_seconds > 0 else 0.0
+        }
+        return summary
+
+
+def merge_stage_stats(summaries, wall_seconds):
+    # Combina las estadísticas de varios segmentos procesados en paralelo
+    merged = {}
+    for name in STAGES:
+        stages = [summary[name] for summary in summaries if name in summary]
+        if not stages:
+            continue
+        items = sum(stage['items'] for stage in stages)
+        busy = sum(stage['busy_seconds'] for stage in stages)
+        merged[name] = {
+            'items': items,
+            'busy_seconds': round(busy, 3),
+            'wait_seconds': round(sum(stage['wait_seconds'] for stage in stages), 3),
+            'items_per_second': round(items / busy, 1) if busy > 0 else 0.0
+        }
+    frames = sum(summary['total']['frames'] for summary in summaries)
+    merged['total'] = {
+        'frames': frames,
+        'inferred_frames': sum(summary['total']['inferred_frames'] for summary in summaries),
+        'wall_seconds': round(wall_seconds, 3),
+        'fps': round(frames / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+        'segments': len(summaries)
+    }
+    return merged
+
+
+def print_stage_stats(summary):
+    print("\n=== RENDIMIENTO POR ETAPA ===")
+    for name in STAGES:
+        if name not in summary:
+            continue
+        stage = summary[name]
+        print(f"  {name}: {stage['items']} frames, {stage['items_per_second']} frames/s "
+              f"(ocupado {stage['busy_seconds']}s, en espera {stage['wait_seconds']}s)")
+    total = summary['total']
+    print(f"  Total: {total['frames']} frames en {total['wall_seconds']}s ({total['fps']} FPS), "
+          f"{total['inferred_frames']} con inferencia")
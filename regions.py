@@ -0,0 +1,143 @@
+import json
+
+import cv2
+import numpy as np
+
+
+def points_in_polygon(points, polygon):
+    # Ray casting vectorizado: cuenta cruces de un rayo horizontal con cada arista
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    straddles = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    crossings = straddles & (x < crossing_x)
+    return crossings.sum(axis=1) % 2 == 1
+
+
+def _orientation(a, b, points):
+    return np.sign((b[0] - a[0]) * (points[:, 1] - a[1]) - (b[1] - a[1]) * (points[:, 0] - a[0]))
+
+
+def segments_cross(starts, ends, line_start, line_end):
+    # Un movimiento cruza la línea si sus extremos quedan a lados opuestos y viceversa
+    side_before = _orientation(line_start, line_end, starts)
+    side_after = _orientation(line_start, line_end, ends)
+    line_side_a = np.sign((ends[:, 0] - starts[:, 0]) * (line_start[1] - starts[:, 1])
+                          - (ends[:, 1] - starts[:, 1]) * (line_start[0] - starts[:, 0]))
+    line_side_b = np.sign((ends[:, 0] - starts[:, 0]) * (line_end[1] - starts[:, 1])
+                          - (ends[:, 1] - starts[:, 1]) * (line_end[0] - starts[:, 0]))
+    return (side_before * side_after < 0) & (line_side_a * line_side_b < 0)
+
+
+class CountingLine:
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+
+
+class CameraRegions:
+    def __init__(self, roi=None, lines=(), frame_scale=1.0):
+        # ROI y líneas en píxeles del video original; frame_scale convierte desde el frame decodificado
+        # cuando el decodificador entrega una resolución reducida
+        self.config = {'roi': roi, 'lines': list(lines)}
+        self.frame_scale = frame_scale
+        self.roi = np.asarray(roi, dtype=np.float64).reshape(-1, 2) if roi else None
+        self.lines = [CountingLine(line.get('name', f'linea_{index + 1}'), *line['points'])
+                      for index, line in enumerate(lines)]
+        self.crop_box = None
+        if self.roi is not None:
+            x0, y0 = np.floor(self.roi.min(axis=0) / frame_scale).astype(int)
+            x1, y1 = np.ceil(self.roi.max(axis=0) / frame_scale).astype(int)
+            self.crop_box = (max(0, int(x0)), max(0, int(y0)), int(x1), int(y1))
+
+    @classmethod
+    def from_config(cls, config):
+        if not config:
+            return None
+        if isinstance(config, str):
+            config = json.loads(config)
+        return cls(roi=config.get('roi'), lines=config.get('lines', ()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_config(json.load(f))
+
+    def with_frame_scale(self, frame_scale):
+        return CameraRegions(frame_scale=frame_scale, **self.config)
+
+    @property
+    def offset(self):
+        if self.crop_box is None:
+            return np.zeros(4, dtype=np.float32)
+        x0, y0, _, _ = self.crop_box
+        return np.array([x0, y0, x0, y0], dtype=np.float32)
+
+    def crop(self, frame):
+        # Vista sin copia: el modelo solo recibe los píxeles del rectángulo que contiene el ROI
+        if self.crop_box is None:
+            return frame
+        x0, y0, x1, y1 = self.crop_box
+        return frame[y0:y1, x0:x1]
+
+    def contains(self, centers):
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if self.roi is None:
+            return np.ones(len(centers), dtype=bool)
+        return points_in_polygon(centers, self.roi)
+
+    def draw(self, frame):
+        if self.roi is not None:
+            cv2.polylines(frame, [(self.roi / self.frame_scale).astype(np.int32)], True, (255, 200, 0), 2)
+        for line in self.lines:
+            start = tuple((line.start / self.frame_scale).astype(int).tolist())
+            end = tuple((line.end / self.frame_scale).astype(int).tolist())
+            cv2.line(frame, start, end, (0, 0, 255), 2)
+            cv2.putText(frame, line.name, start, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+
+class LineCounter:
+    def __init__(self, lines):
+        self.lines = lines
+        self.counts = {line.name: {} for line in lines}
+        self._last_centers = {}
+        self._counted = set()
+        self._crossed_tracks = set()
+
+    def update(self, object_ids, centers, class_names, active_ids, count=True):
+        # Cada track suma una vez por línea, pero solo se reporta (y se guarda) la primera línea que cruza;
+        # con count=False se actualiza el estado sin contar (ventana de solapamiento entre segmentos)
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        known = np.array([object_id in self._last_centers for object_id in object_ids], dtype=bool)
+        crossed = {}
+        if known.any():
+            rows = np.flatnonzero(known)
+            starts = np.array([self._last_centers[object_ids[row]] for row in rows])
+            for line in self.lines:
+                crosses = segments_cross(starts, centers[rows], line.start, line.end)
+                for row in rows[crosses]:
+                    key = (object_ids[row], line.name)
+                    if key in self._counted:
+                        continue
+                    self._counted.add(key)
+                    if not count:
+                        self._crossed_tracks.add(object_ids[row])
+                        continue
+                    counts = self.counts[line.name]
+                    counts[class_names[row]] = counts.get(class_names[row], 0) + 1
+                    if object_ids[row] not in self._crossed_tracks:
+                        crossed.setdefault(row, line.name)
+        self._crossed_tracks.update(object_ids[row] for row in crossed)
+
+        for object_id, center in zip(object_ids, centers):
+            self._last_centers[object_id] = center
+        # Se olvidan los tracks que el tracker ya descartó
+        active = set(active_ids)
+        for object_id in [object_id for object_id in self._last_centers if object_id not in active]:
+            del self._last_centers[object_id]
+        self._counted = {key for key in self._counted if key[0] in active}
+        self._crossed_tracks &= active
+        return crossed
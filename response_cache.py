@@ -0,0 +1,85 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import make_response, request
+
+# Locks de cálculo compartidos por hash de la clave: su número es fijo, así que no crecen con las consultas
+# distintas; dos claves del mismo grupo solo esperan una a la otra al recalcular
+LOCK_STRIPES = 64
+
+
+class CachedResponse:
+    def __init__(self, version, data, status, mimetype):
+        self.version = version
+        self.data = data
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(data).hexdigest()
+        # Precisión de segundos, como la cabecera Last-Modified
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, lock_stripes=LOCK_STRIPES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._key_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            return None
+
+    def get_or_compute(self, key, version, compute):
+        entry = self._lookup(key, version)
+        if entry is not None:
+            return entry
+
+        # Una sola petición recalcula cada clave; las concurrentes esperan su resultado
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            entry = self._lookup(key, version)
+            if entry is not None:
+                return entry
+            entry = compute()
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, version_fn):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                version = version_fn()
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+
+                def compute():
+                    response = make_response(view(*args, **kwargs))
+                    return CachedResponse(version, response.get_data(), response.status_code, response.mimetype)
+
+                entry = self.get_or_compute(key, version, compute)
+                response = make_response(entry.data, entry.status)
+                response.mimetype = entry.mimetype
+                response.set_etag(entry.etag)
+                response.last_modified = entry.last_modified
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+GEOHASH_ALPHABET = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+# Precisiones precalculadas, de ~40 km (4) a ~38 m (8); la más fina ya distingue cámaras en la misma calle
+GEOHASH_PRECISIONS = (4, 5, 6, 7, 8)
+# Zoom del mapa a partir del cual se usa cada precisión (celdas de pocos píxeles a ese zoom)
+ZOOM_PRECISIONS = ((0, 4), (9, 5), (12, 6), (14, 7), (16, 8))
+
+
+def precision_for_zoom(zoom):
+    if zoom is None:
+        return GEOHASH_PRECISIONS[-1]
+    precision = ZOOM_PRECISIONS[0][1]
+    for min_zoom, level in ZOOM_PRECISIONS:
+        if zoom >= min_zoom:
+            precision = level
+    return precision
+
+
+def _grid_bits(precision):
+    # El geohash intercala bits empezando por la longitud
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def cell_indices(lat, lng, precision):
+    lng_bits, lat_bits = _grid_bits(precision)
+    lng_index = np.floor((np.asarray(lng, dtype=np.float64) + 180) / 360 * (1 << lng_bits)).astype(np.int64)
+    lat_index = np.floor((np.asarray(lat, dtype=np.float64) + 90) / 180 * (1 << lat_bits)).astype(np.int64)
+    return (np.clip(lat_index, 0, (1 << lat_bits) - 1), np.clip(lng_index, 0, (1 << lng_bits) - 1))
+
+
+def cell_centers(lat_index, lng_index, precision):
+    lng_bits, lat_bits = _grid_bits(precision)
+    lat = (lat_index + 0.5) * 180 / (1 << lat_bits) - 90
+    lng = (lng_index + 0.5) * 360 / (1 << lng_bits) - 180
+    return lat, lng
+
+
+def geohash_cells(lat_index, lng_index, precision):
+    lng_bits, lat_bits = _grid_bits(precision)
+    lat_index = np.asarray(lat_index, dtype=np.int64)
+    lng_index = np.asarray(lng_index, dtype=np.int64)
+    code = np.zeros(len(lat_index), dtype=np.int64)
+    for bit in range(5 * precision):
+        # Bits pares de longitud y bits impares de latitud, del más significativo al menos
+        if bit % 2 == 0:
+            value = (lng_index >> (lng_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_index >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+    chars = [GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - position))) & 31] for position in range(precision)]
+    return [''.join(row) for row in zip(*chars)] if len(code) else []
+
+
+def geohash(lat, lng, precision=GEOHASH_PRECISIONS[-1]):
+    lat_index, lng_index = cell_indices([lat], [lng], precision)
+    return geohash_cells(lat_index, lng_index, precision)[0]
+
+
+def parse_bbox(value):
+    # "min_lng,min_lat,max_lng,max_lat", el mismo orden que map.getBounds().toArray().flat()
+    if not value:
+        return None
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError('bbox inválido')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+class SpatialIndex:
+    # Conteos por celda de geohash y día de la semana, agrupados una vez por precisión a partir del rollup;
+    # cada consulta del mapa solo filtra y suma arreglos ya agrupados
+    def __init__(self, rollup, precisions=GEOHASH_PRECISIONS):
+        located = rollup.dropna(subset=['location_lat', 'location_lng'])
+        day_of_week = located['date'].dt.dayofweek.to_numpy()
+        lat = located['location_lat'].to_numpy()
+        lng = located['location_lng'].to_numpy()
+        count = located['count'].to_numpy()
+        self.levels = {}
+        for precision in precisions:
+            lat_index, lng_index = cell_indices(lat, lng, precision)
+            cells = pd.DataFrame({'lat_index': lat_index, 'lng_index': lng_index, 'day_of_week': day_of_week,
+                                  'count': count})
+            cells = cells.groupby(['lat_index', 'lng_index', 'day_of_week'], sort=True)['count'].sum().reset_index()
+            center_lat, center_lng = cell_centers(cells['lat_index'].to_numpy(), cells['lng_index'].to_numpy(),
+                                                  precision)
+            self.levels[precision] = {
+                'lat_index': cells['lat_index'].to_numpy(),
+                'lng_index': cells['lng_index'].to_numpy(),
+                'day_of_week': cells['day_of_week'].to_numpy(),
+                'count': cells['count'].to_numpy(),
+                'lat': center_lat,
+                'lng': center_lng
+            }
+
+    def query(self, bbox=None, zoom=None, day_of_week=None):
+        precision = precision_for_zoom(zoom)
+        level = self.levels[precision]
+        mask = np.ones(len(level['count']), dtype=bool)
+        if bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            mask &= ((level['lng'] >= min_lng) & (level['lng'] <= max_lng)
+                     & (level['lat'] >= min_lat) & (level['lat'] <= max_lat))
+        if day_of_week is not None:
+            mask &= level['day_of_week'] == day_of_week
+
+        cells = pd.DataFrame({name: level[name][mask] for name in ('lat_index', 'lng_index', 'lat', 'lng', 'count')})
+        cells = cells.groupby(['lat_index', 'lng_index'], sort=False).agg(
+            lat=('lat', 'first'), lng=('lng', 'first'), count=('count', 'sum')).reset_index()
+        cells['geohash'] = geohash_cells(cells['lat_index'].to_numpy(), cells['lng_index'].to_numpy(), precision)
+        return precision, cells
+
+    def features(self, bbox=None, zoom=None, day_of_week=None):
+        precision, cells = self.query(bbox, zoom, day_of_week)
+        return [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            'properties': {'intensity': count, 'geohash': cell, 'precision': precision}
+        } for lat, lng, count, cell in zip(cells['lat'].round(6).tolist(), cells['lng'].round(6).tolist(),
+                                           cells['count'].tolist(), cells['geohash'].tolist())]
@@ -4,6 +4,7 @@ let selectedLocation = null;
 let currentVideoFile = null;
 let weekChart = null;
 let hourChart = null;
+let currentDayFilter = null;
 
 const map = new mapboxgl.Map({
     container: 'map',
@@ -97,6 +98,34 @@ map.on('load', () => {
     loadStats();
 });
 
+// El servidor devuelve solo las celdas visibles, agrupadas según el zoom
+async function loadHeatmap() {
+    if (!map.getSource('heatmap-data')) return;
+    const bounds = map.getBounds();
+    const params = new URLSearchParams({
+        bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+            .map(value => value.toFixed(4)).join(','),
+        zoom: Math.floor(map.getZoom())
+    });
+    if (currentDayFilter && currentDayFilter !== 'all') {
+        params.append('day', currentDayFilter);
+    }
+    
+    try {
+        const response = await fetch(`/api/stats/heatmap?${params.toString()}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        map.getSource('heatmap-data').setData({
+            type: 'FeatureCollection',
+            features: data.features
+        });
+    } catch (error) {
+        console.error('Error al cargar el mapa de calor:', error);
+    }
+}
+
+map.on('moveend', loadHeatmap);
+
 function updateLocationDisplay(lngLat) {
     selectedLocation = lngLat;
     document.getElementById('coords').textContent = 
@@ -153,43 +182,32 @@ function handleVideoFile(file) {
     analyzeBtn.disabled = false;
 }
 
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
 analyzeBtn.addEventListener('click', async () => {
     if (!currentVideoFile) return;
     
-    const formData = new FormData();
-    formData.append('video', currentVideoFile);
-    formData.append('location', JSON.stringify({
+    const location = {
         lat: selectedLocation.lat,
         lng: selectedLocation.lng
-    }));
+    };
     
     document.getElementById('loadingModal').classList.add('active');
     
     try {
-        const uploadResponse = await fetch('/api/upload', {
-            method: 'POST',
-            body: formData
-        });
-        
-        const uploadResult = await uploadResponse.json();
+        const analyzeJob = await uploadInChunks(currentVideoFile, location);
+        // Un video ya analizado devuelve el resumen guardado sin crear un trabajo
+        const analyzeResult = analyzeJob.cached ? analyzeJob.result : await waitForJob(analyzeJob.job_id);
         
-        if (uploadResult.success) {
-            const locationParam = encodeURIComponent(JSON.stringify({
-                lat: selectedLocation.lat,
-                lng: selectedLocation.lng
-            }));
-            const analyzeResponse = await fetch(`/api/analyze/${uploadResult.filename}?location=${locationParam}`);
-            const analyzeResult = await analyzeResponse.json();
-            
-            if (analyzeResult.success) {
-                uploadStatus.className = 'success';
-                uploadStatus.textContent = `Análisis completado: ${analyzeResult.cars_detected} autos detectados`;
-                await loadStats();
-            } else {
-                throw new Error(analyzeResult.error);
-            }
+        if (analyzeResult.success) {
+            uploadStatus.className = 'success';
+            uploadStatus.textContent = analyzeResult.cached
+                ? `Video ya analizado: ${analyzeResult.cars_detected} autos detectados`
+                : `Análisis completado: ${analyzeResult.cars_detected} autos detectados`;
+            await loadStats();
         } else {
-            throw new Error(uploadResult.error);
+            throw new Error(analyzeResult.error);
         }
     } catch (error) {
         uploadStatus.className = 'error';
@@ -199,7 +217,91 @@ analyzeBtn.addEventListener('click', async () => {
     }
 });
 
+async function uploadInChunks(file, location) {
+    const createResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, location: location })
+    });
+    const upload = await createResponse.json();
+    
+    if (!createResponse.ok) {
+        throw new Error(upload.error);
+    }
+    
+    let offset = upload.offset;
+    let retries = 0;
+    
+    while (offset < file.size) {
+        try {
+            const chunkResponse = await fetch(`/api/uploads/${upload.upload_id}`, {
+                method: 'PATCH',
+                headers: { 'Upload-Offset': String(offset) },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+            const chunk = await chunkResponse.json();
+            
+            if (chunkResponse.status === 409) {
+                // El servidor indica dónde continuar
+                offset = chunk.offset;
+                continue;
+            }
+            if (!chunkResponse.ok) {
+                throw new Error(chunk.error);
+            }
+            
+            offset = chunk.offset;
+            retries = 0;
+        } catch (error) {
+            if (++retries > UPLOAD_MAX_RETRIES) {
+                throw error;
+            }
+            // Se reanuda desde el offset que el servidor realmente guardó
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const statusResponse = await fetch(`/api/uploads/${upload.upload_id}`);
+            if (statusResponse.ok) {
+                offset = (await statusResponse.json()).offset;
+            }
+        }
+        
+        uploadStatus.className = 'success';
+        uploadStatus.textContent = `Subiendo: ${Math.round(offset / file.size * 100)}%`;
+    }
+    
+    const completeResponse = await fetch(`/api/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+    const analyzeJob = await completeResponse.json();
+    
+    if (!analyzeJob.success) {
+        throw new Error(analyzeJob.error);
+    }
+    return analyzeJob;
+}
+
+async function waitForJob(jobId) {
+    while (true) {
+        const statusResponse = await fetch(`/api/jobs/${jobId}`);
+        const job = await statusResponse.json();
+        
+        if (!statusResponse.ok || job.status === 'error') {
+            throw new Error(job.error || 'Error en el análisis');
+        }
+        
+        if (job.status === 'done') {
+            const resultResponse = await fetch(`/api/jobs/${jobId}/result`);
+            return await resultResponse.json();
+        }
+        
+        uploadStatus.className = 'success';
+        uploadStatus.textContent = job.status === 'queued'
+            ? 'Análisis en cola...'
+            : `Analizando: ${job.progress}% (${job.frames_processed}/${job.total_frames} frames)`;
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 async function loadStats(startDate = null, endDate = null, dayFilter = null) {
+    currentDayFilter = dayFilter;
     try {
         let url = '/api/stats';
         const params = new URLSearchParams();
@@ -433,12 +535,7 @@ function updateStats(data) {
         document.getElementById('peakHour').textContent = `${maxHour[0]}:00`;
     }
     
-    if (data.heatmap_data && map.getSource('heatmap-data')) {
-        map.getSource('heatmap-data').setData({
-            type: 'FeatureCollection',
-            features: data.heatmap_data
-        });
-    }
+    loadHeatmap();
 }
 
 document.getElementById('dayFilter').addEventListener('change', (e) => {
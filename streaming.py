@@ -0,0 +1,177 @@
+import hashlib
+import os
+import pickle
+import queue
+import threading
+import time
+
+import numpy as np
+
+from detection_store import save_detections
+from detections import records_to_dicts
+
+# none: el sistema operativo decide cuándo escribir; checkpoint: solo se sincroniza el archivo de
+# reanudación; batch: además cada lote del almacén (más lento, pero nada confirmado se pierde)
+FSYNC_POLICIES = ('none', 'checkpoint', 'batch')
+DEFAULT_FSYNC = 'checkpoint'
+FLUSH_ROWS = 5000
+FLUSH_SECONDS = 10.0
+# Frames entre checkpoints: acota lo que se vuelve a procesar al reanudar
+CHECKPOINT_FRAMES = 1800
+CHECKPOINT_DIR = 'checkpoints'
+# Mensajes pendientes (uno por frame con detecciones) antes de frenar al análisis
+WRITER_QUEUE_SIZE = 1024
+
+
+def _video_identity(video_path):
+    stat = os.stat(video_path)
+    return {'video': os.path.abspath(video_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def checkpoint_path(video_path, start_frame=0, checkpoint_dir=CHECKPOINT_DIR):
+    identity = _video_identity(video_path)
+    key = hashlib.sha1(f"{identity['video']}:{identity['size']}:{identity['mtime']}".encode()).hexdigest()[:16]
+    return os.path.join(checkpoint_dir, f"{os.path.basename(video_path)}.{key}.{start_frame}.ckpt")
+
+
+def load_checkpoint(path, video_path, start_frame=0, end_frame=None):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        state = pickle.loads(saved['state'])
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        return None
+    # Un checkpoint de otro archivo u otra división en segmentos no sirve para reanudar
+    expected = dict(_video_identity(video_path), start_frame=start_frame, end_frame=end_frame)
+    if any(state.get(key) != value for key, value in expected.items()):
+        return None
+    state['persisted_frame'] = saved['persisted_frame']
+    return state
+
+
+def remove_checkpoint(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+class StreamingWriter:
+    # Guarda las detecciones en lotes desde un hilo aparte mientras sigue el análisis. Los checkpoints pasan
+    # por la misma cola, así que solo se escriben cuando todas las detecciones anteriores ya están guardadas.
+    # Cada lote actualiza además el último frame guardado: al reanudar desde el checkpoint las detecciones
+    # hasta ese frame se recalculan para el tracker pero no se vuelven a guardar.
+    def __init__(self, store, names, location=None, checkpoint_path=None, fsync=DEFAULT_FSYNC,
+                 flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS, metrics=None, on_flush=None,
+                 persisted_frame=0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync no válida: {fsync}")
+        self.store = store
+        self.names = names
+        self.location = location
+        self.checkpoint_path = checkpoint_path
+        self.fsync = fsync
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.metrics = metrics
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self.persisted_frame = persisted_frame
+        self.error = None
+        self._state = None
+        self._queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name='escritor-detecciones', daemon=True)
+        self._thread.start()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"Error al guardar detecciones: {self.error}") from self.error
+
+    def add(self, records):
+        self._check()
+        if len(records):
+            self._queue.put(('records', records))
+
+    def checkpoint(self, state):
+        # Se serializa ahora: el tracker sigue cambiando mientras el escritor guarda el lote
+        self._check()
+        if self.checkpoint_path:
+            self._queue.put(('checkpoint', pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def close(self):
+        self._queue.put(('close', None))
+        self._thread.join()
+        self._check()
+        return self.rows_written
+
+    def abort(self):
+        # Ante un error en el análisis: detiene el hilo sin guardar lo pendiente. El checkpoint sigue
+        # describiendo lo ya guardado, así que al reanudar esas detecciones se recalculan una sola vez.
+        self._queue.put(('abort', None))
+        self._thread.join()
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                kind, payload = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                kind, payload = 'tick', None
+            if kind == 'abort':
+                return
+            if self.error is not None:
+                # Tras un error se sigue vaciando la cola para no bloquear el análisis
+                if kind == 'close':
+                    return
+                continue
+
+            try:
+                if kind == 'records':
+                    pending.append(payload)
+                    pending_rows += len(payload)
+                due = (kind != 'records' or pending_rows >= self.flush_rows
+                       or time.monotonic() - last_flush >= self.flush_seconds)
+                if pending and due:
+                    self._flush(np.concatenate(pending))
+                    pending, pending_rows = [], 0
+                    last_flush = time.monotonic()
+                if kind == 'checkpoint':
+                    self._state = payload
+                    self._write_checkpoint()
+            except Exception as e:
+                self.error = e
+            if kind == 'close':
+                return
+
+    def _flush(self, records):
+        start = time.perf_counter()
+        save_detections(self.store, records_to_dicts(records, self.names), self.location)
+        if self.metrics is not None:
+            self.metrics.observe('persist_seconds', time.perf_counter() - start)
+        self.rows_written += len(records)
+        self.persisted_frame = max(self.persisted_frame, int(records['frame_number'].max()))
+        if self._state is not None:
+            self._write_checkpoint()
+        if self.on_flush is not None:
+            self.on_flush(records)
+
+    def _write_checkpoint(self):
+        data = pickle.dumps({'state': self._state, 'persisted_frame': self.persisted_frame})
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+            if self.fsync != 'none':
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+
+def checkpoint_state(video_path, start_frame, end_frame, frame_number, tracker, line_counter, class_counts,
+                     start_time=None):
+    return dict(_video_identity(video_path), start_frame=start_frame, end_frame=end_frame, frame=frame_number,
+                tracker=tracker, line_counter=line_counter, class_counts=dict(class_counts), start_time=start_time)
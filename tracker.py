@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+TRACKER_METRICS = ('distance', 'iou')
+
+# Costo asignado a pares no válidos (otra clase o fuera del umbral)
+_INVALID_COST = 1e9
+VELOCITY_SMOOTHING = 0.5
+
+
+def box_iou(boxes_a, boxes_b):
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class CentroidTracker:
+    def __init__(self, max_distance_threshold=100, max_frames_disappeared=30, metric='distance', min_iou=0.3):
+        if metric not in TRACKER_METRICS:
+            raise ValueError(f"Métrica de tracking no válida: {metric}")
+        self.max_distance_threshold = max_distance_threshold
+        self.max_frames_disappeared = max_frames_disappeared
+        self.metric = metric
+        self.min_iou = min_iou
+        self.next_object_id = 1
+        self.last_update_frame = None
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.classes = np.empty(0, dtype=np.int32)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.centers = np.empty((0, 2), dtype=np.float32)
+        self.velocities = np.empty((0, 2), dtype=np.float32)
+        self.disappeared = np.empty(0, dtype=np.int32)
+        self.first_frame = np.empty(0, dtype=np.int64)
+        self.last_frame = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keep(self, mask):
+        self.ids = self.ids[mask]
+        self.classes = self.classes[mask]
+        self.boxes = self.boxes[mask]
+        self.centers = self.centers[mask]
+        self.velocities = self.velocities[mask]
+        self.disappeared = self.disappeared[mask]
+        self.first_frame = self.first_frame[mask]
+        self.last_frame = self.last_frame[mask]
+
+    def _append(self, ids, classes, boxes, centers, frame_number):
+        count = len(ids)
+        self.ids = np.concatenate([self.ids, ids])
+        self.classes = np.concatenate([self.classes, classes])
+        self.boxes = np.concatenate([self.boxes, boxes])
+        self.centers = np.concatenate([self.centers, centers])
+        self.velocities = np.concatenate([self.velocities, np.zeros((count, 2), dtype=np.float32)])
+        self.disappeared = np.concatenate([self.disappeared, np.zeros(count, dtype=np.int32)])
+        self.first_frame = np.concatenate([self.first_frame, np.full(count, frame_number, dtype=np.int64)])
+        self.last_frame = np.concatenate([self.last_frame, np.full(count, frame_number, dtype=np.int64)])
+
+    def _cost_matrix(self, boxes, centers, class_ids, frame_number):
+        # Posición esperada de cada track según su velocidad, útil cuando se omiten frames
+        shift = self.velocities * (frame_number - self.last_frame)[:, None]
+        if self.metric == 'iou':
+            iou = box_iou(boxes, self.boxes + np.tile(shift, 2))
+            cost = 1.0 - iou
+            valid = iou >= self.min_iou
+        else:
+            offsets = centers[:, None, :] - (self.centers + shift)[None, :, :]
+            cost = np.sqrt((offsets ** 2).sum(axis=2))
+            valid = cost < self.max_distance_threshold
+        valid &= class_ids[:, None] == self.classes[None, :]
+        return np.where(valid, cost, _INVALID_COST), valid
+
+    def update(self, boxes, class_ids, frame_number):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        class_ids = np.asarray(class_ids, dtype=np.int32).reshape(-1)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+
+        frames_elapsed = 1 if self.last_update_frame is None else frame_number - self.last_update_frame
+        self.last_update_frame = frame_number
+        self.disappeared += frames_elapsed
+        self._keep(self.disappeared <= self.max_frames_disappeared)
+
+        object_ids = np.zeros(len(boxes), dtype=np.int64)
+        matched = np.zeros(len(boxes), dtype=bool)
+
+        if len(boxes) and len(self.ids):
+            cost, valid = self._cost_matrix(boxes, centers, class_ids, frame_number)
+            rows, cols = linear_sum_assignment(cost)
+            accepted = valid[rows, cols]
+            rows, cols = rows[accepted], cols[accepted]
+
+            object_ids[rows] = self.ids[cols]
+            matched[rows] = True
+            gap = (frame_number - self.last_frame[cols])[:, None]
+            velocity = (centers[rows] - self.centers[cols]) / np.maximum(gap, 1)
+            self.velocities[cols] = (VELOCITY_SMOOTHING * self.velocities[cols]
+                                     + (1 - VELOCITY_SMOOTHING) * velocity)
+            self.boxes[cols] = boxes[rows]
+            self.centers[cols] = centers[rows]
+            self.disappeared[cols] = 0
+            self.last_frame[cols] = frame_number
+
+        is_new = ~matched
+        new_count = int(is_new.sum())
+        if new_count:
+            new_ids = np.arange(self.next_object_id, self.next_object_id + new_count, dtype=np.int64)
+            self.next_object_id += new_count
+            object_ids[is_new] = new_ids
+            self._append(new_ids, class_ids[is_new], boxes[is_new], centers[is_new], frame_number)
+
+        return object_ids, is_new
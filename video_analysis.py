@@ -0,0 +1,283 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from capture_time import capture_start_time
+from detection_store import open_store
+from detections import DetectionLog, box_centers, box_coordinates, parse_boxes, records_to_dicts
+from metrics import MetricsRegistry, metric_key
+from model_registry import DEFAULT_INFERENCE_BACKEND, DEFAULT_MODEL, get_model
+from pipeline import DetectionPipeline, merge_stage_stats
+from regions import CameraRegions, LineCounter
+from streaming import (CHECKPOINT_DIR, CHECKPOINT_FRAMES, DEFAULT_FSYNC, FLUSH_ROWS, StreamingWriter, checkpoint_path,
+                       checkpoint_state, load_checkpoint, remove_checkpoint)
+from tracker import CentroidTracker
+from video_io import FrameRange, FrameSampler, open_video
+
+TRACKER_MAX_DISTANCE = 100
+TRACKER_MAX_DISAPPEARED = 30
+
+# Frames anteriores a cada segmento que solo reconstruyen los tracks activos en la frontera;
+# con la misma ventana que max_frames_disappeared el resultado coincide con el recorrido secuencial
+SEGMENT_OVERLAP_FRAMES = TRACKER_MAX_DISAPPEARED
+# Por debajo de este tamaño no compensa lanzar procesos y cargar el modelo en cada uno
+MIN_SEGMENT_FRAMES = 1500
+# Segundos entre reportes de progreso mientras corren los segmentos
+PROGRESS_INTERVAL = 1.0
+
+
+def plan_segments(total_frames, segments, overlap_frames=SEGMENT_OVERLAP_FRAMES,
+                  min_segment_frames=MIN_SEGMENT_FRAMES):
+    segments = max(1, min(int(segments), total_frames // max(1, min_segment_frames)))
+    bounds = np.linspace(0, total_frames, segments + 1).astype(int).tolist()
+    plan = [(max(0, start - overlap_frames), start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+    # El último segmento lee hasta el final del archivo: CAP_PROP_FRAME_COUNT puede ser aproximado
+    warmup_start, start, _ = plan[-1]
+    plan[-1] = (warmup_start, start, None)
+    return plan
+
+
+def analyze_segment(video_path, start_frame=0, end_frame=None, warmup_start=None, confidence_threshold=0.5,
+                    model_name=DEFAULT_MODEL, batch_size=1, frame_stride=1, motion_threshold=None, regions=None,
+                    decode_options=None, inference_backend=DEFAULT_INFERENCE_BACKEND, persist=None,
+                    start_time=None, progress_callback=None):
+    # start_time: época del inicio de la grabación (por defecto, de los metadatos o el nombre del archivo).
+    # persist: {"store": {"backend", "path"}, "location", "fsync", "flush_rows", "checkpoint_dir",
+    # "checkpoint_frames"}; las detecciones se guardan durante el análisis y se puede reanudar. El checkpoint
+    # se devuelve sin borrar: analyze_video lo quita cuando todos los segmentos terminaron bien
+    model = get_model(model_name, inference_backend)
+    start_time, _ = capture_start_time(video_path, start_time)
+    if isinstance(regions, (dict, str)):
+        regions = CameraRegions.from_config(regions)
+    cap = open_video(video_path, **(decode_options or {}))
+
+    if not cap.isOpened():
+        return {'error': 'No se pudo abrir el video'}
+
+    # Con decodificación a resolución reducida las cajas se llevan a píxeles del video original
+    frame_scale = getattr(cap, 'frame_scale', 1.0)
+    if regions is not None:
+        regions = regions.with_frame_scale(frame_scale)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    warmup_start = start_frame if warmup_start is None else warmup_start
+
+    frame_count = warmup_start
+    detection_log = DetectionLog(keep_records=persist is None)
+    tracker = CentroidTracker(max_distance_threshold=TRACKER_MAX_DISTANCE,
+                              max_frames_disappeared=TRACKER_MAX_DISAPPEARED)
+    line_counter = LineCounter(regions.lines) if regions is not None and regions.lines else None
+    # Las cajas del recorte se devuelven a coordenadas del frame completo
+    offset = regions.offset if regions is not None else 0
+
+    metrics = MetricsRegistry()
+    writer = checkpoint = resumed_from = None
+    persisted_frame = 0
+    checkpoint_frames = CHECKPOINT_FRAMES
+    if persist is not None:
+        checkpoint = checkpoint_path(video_path, start_frame, persist.get('checkpoint_dir', CHECKPOINT_DIR))
+        state = load_checkpoint(checkpoint, video_path, start_frame, end_frame)
+        if state is not None:
+            # Se retoma con el tracker y los conteos del último lote guardado, sin ventana de calentamiento
+            frame_count = resumed_from = state['frame']
+            tracker, line_counter = state['tracker'], state['line_counter']
+            detection_log.class_counts = state['class_counts']
+            persisted_frame = state['persisted_frame']
+            # Las filas ya guardadas usaron ese inicio; se conserva aunque sea el momento del primer intento
+            start_time = state.get('start_time') or start_time
+        fsync = persist.get('fsync', DEFAULT_FSYNC)
+        store = open_store(**persist['store'], fsync=fsync == 'batch')
+        writer = StreamingWriter(store, model.names, location=persist.get('location'), checkpoint_path=checkpoint,
+                                 fsync=fsync, flush_rows=persist.get('flush_rows', FLUSH_ROWS), metrics=metrics,
+                                 persisted_frame=persisted_frame)
+        checkpoint_frames = persist.get('checkpoint_frames', CHECKPOINT_FRAMES)
+        if state is None:
+            # Punto de partida: los lotes guardados antes del primer checkpoint también quedan registrados
+            writer.checkpoint(checkpoint_state(video_path, start_frame, end_frame, frame_count, tracker,
+                                               line_counter, detection_log.class_counts, start_time))
+
+    frames = FrameRange(cap, frame_count, end_frame)
+    try:
+        sampler = FrameSampler(frame_stride=frame_stride, motion_threshold=motion_threshold, start_index=frame_count)
+        pipeline = DetectionPipeline(frames, model, confidence_threshold, batch_size=batch_size, sampler=sampler,
+                                     metrics=metrics, preprocess=regions.crop if regions is not None else None)
+        for frame, result in pipeline.frames():
+            frame_count += 1
+
+            boxes = parse_boxes(result, offset, frame_scale)
+            centers = box_centers(boxes)
+
+            # Las detecciones fuera del ROI no llegan al tracker
+            if regions is not None and len(boxes):
+                inside = regions.contains(centers)
+                boxes, centers = boxes[inside], centers[inside]
+
+            # En frames omitidos por el muestreo el tracker conserva su estado
+            is_new = None
+            if result is not None:
+                object_ids, is_new = tracker.update(box_coordinates(boxes), boxes['class_id'], frame_count)
+                # Con líneas de conteo se registra cada track al cruzar, no al aparecer
+                if line_counter is not None:
+                    crossed = line_counter.update(object_ids, centers,
+                                                  [model.names[class_id] for class_id in boxes['class_id'].tolist()],
+                                                  tracker.ids, count=frame_count > start_frame)
+                    is_new = np.zeros(len(boxes), dtype=bool)
+                    is_new[list(crossed)] = True
+
+            # Los objetos vistos en la ventana de solapamiento ya los contó el segmento anterior
+            if frame_count <= start_frame:
+                continue
+
+            if is_new is not None and is_new.any():
+                time_seconds = frame_count / fps
+                records = detection_log.add(boxes[is_new], frame_count, time_seconds, start_time + time_seconds)
+                if writer is not None and frame_count > persisted_frame:
+                    writer.add(records)
+            if writer is not None and frame_count % checkpoint_frames == 0:
+                writer.checkpoint(checkpoint_state(video_path, start_frame, end_frame, frame_count, tracker,
+                                                   line_counter, detection_log.class_counts, start_time))
+
+            if progress_callback and frame_count % 30 == 0:
+                gauges = {metric_key('queue_depth', queue=name): depth
+                          for name, depth in pipeline.queue_depths().items()}
+                gauges[metric_key('active_tracks')] = len(tracker)
+                progress_callback(frame_count - start_frame, total_frames, gauges=gauges)
+    except BaseException:
+        # Sin esto el hilo del escritor seguiría vivo en el worker y guardaría filas de un análisis fallido
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        frames.release()
+    persisted = 0
+    if writer is not None:
+        persisted = writer.close()
+
+    detections_summary = detection_log.summary(model.names)
+    stage_stats = pipeline.stage_stats()
+    metrics.inc('frames_processed_total', stage_stats['total']['frames'])
+    metrics.inc('frames_inferred_total', stage_stats['total']['inferred_frames'])
+    for class_name, count in detections_summary.items():
+        metrics.inc('detections_total', count, object_class=class_name)
+
+    return {
+        'total_frames': total_frames,
+        'frames': max(0, frame_count - start_frame),
+        'summary': detections_summary,
+        # Arreglo estructurado: se pasa entre procesos sin un dict por detección
+        'records': detection_log.records(),
+        'class_names': dict(model.names),
+        'persisted': persisted,
+        'resumed_from': resumed_from,
+        'stage_stats': stage_stats,
+        'line_counts': line_counter.counts if line_counter is not None else None,
+        'start_time': start_time,
+        'checkpoint': checkpoint,
+        'metrics': metrics.snapshot()
+    }
+
+
+def _analyze_reporting(progress, index, *args, **kwargs):
+    # Cada segmento deja sus frames procesados en el dict compartido; el proceso principal los suma
+    def report(frames_processed, total_frames, gauges=None):
+        progress[index] = frames_processed
+
+    return analyze_segment(*args, progress_callback=report, **kwargs)
+
+
+def analyze_video(video_path, workers=1, confidence_threshold=0.5, model_name=DEFAULT_MODEL, batch_size=1,
+                  frame_stride=1, motion_threshold=None, regions=None, decode_options=None,
+                  inference_backend=DEFAULT_INFERENCE_BACKEND, persist=None, start_time=None,
+                  overlap_frames=SEGMENT_OVERLAP_FRAMES, min_segment_frames=MIN_SEGMENT_FRAMES, progress_callback=None):
+    # Se resuelve una vez para que todos los segmentos compartan el mismo inicio
+    start_time, time_source = capture_start_time(video_path, start_time)
+    options = {
+        'confidence_threshold': confidence_threshold,
+        'model_name': model_name,
+        'batch_size': batch_size,
+        'frame_stride': frame_stride,
+        'motion_threshold': motion_threshold,
+        'regions': regions,
+        'decode_options': decode_options,
+        'inference_backend': inference_backend,
+        'persist': persist,
+        'start_time': start_time
+    }
+    # Varios procesos agregando al mismo CSV intercalarían filas; ese backend se escribe desde un solo segmento
+    if persist is not None and persist['store'].get('backend') == 'csv':
+        workers = 1
+
+    cap = open_video(video_path, **(decode_options or {}))
+    if not cap.isOpened():
+        return {'error': 'No se pudo abrir el video'}
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segments = plan_segments(total_frames, workers, overlap_frames, min_segment_frames)
+    if len(segments) == 1:
+        result = analyze_segment(video_path, progress_callback=progress_callback, **options)
+        if 'error' not in result:
+            # Análisis completo: el próximo del mismo archivo empieza de cero
+            remove_checkpoint(result.pop('checkpoint'))
+            result['detections'] = records_to_dicts(result.pop('records'), result.pop('class_names'))
+            result['time_source'] = time_source
+        return result
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=len(segments), mp_context=context) as executor:
+        progress = manager.dict()
+        futures = [executor.submit(_analyze_reporting, progress, index, video_path, start, end, warmup_start,
+                                   **options)
+                   for index, (warmup_start, start, end) in enumerate(segments)]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+            if progress_callback:
+                progress_callback(sum(progress.values()), total_frames)
+        results = [future.result() for future in futures]
+    frames_processed = sum(result.get('frames', 0) for result in results)
+    if progress_callback:
+        progress_callback(frames_processed, total_frames)
+
+    for result in results:
+        if 'error' in result:
+            return result
+    # Recién ahora se borran: si un segmento hubiera fallado, reanudar los demás no vuelve a guardar sus filas
+    for result in results:
+        remove_checkpoint(result.pop('checkpoint'))
+
+    # Cada objeto lo cuenta solo el segmento donde aparece por primera vez, así que basta con sumar
+    detections_summary = {}
+    line_counts = None
+    persisted = 0
+    metrics = MetricsRegistry()
+    for result in results:
+        metrics.merge(result['metrics'])
+        persisted += result['persisted']
+        for line_name, counts in (result['line_counts'] or {}).items():
+            line_counts = line_counts or {}
+            merged = line_counts.setdefault(line_name, {})
+            for class_name, count in counts.items():
+                merged[class_name] = merged.get(class_name, 0) + count
+        for class_name, count in result['summary'].items():
+            detections_summary[class_name] = detections_summary.get(class_name, 0) + count
+    records = np.concatenate([result['records'] for result in results])
+
+    return {
+        'total_frames': total_frames,
+        'frames': frames_processed,
+        'summary': detections_summary,
+        'detections': records_to_dicts(records, results[0]['class_names']),
+        'persisted': persisted,
+        'stage_stats': merge_stage_stats([result['stage_stats'] for result in results],
+                                         time.perf_counter() - started),
+        'line_counts': line_counts,
+        'start_time': start_time,
+        'time_source': time_source,
+        'metrics': metrics.snapshot()
+    }
@@ -0,0 +1,286 @@
+import collections
+import json
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+DECODERS = ('opencv', 'ffmpeg')
+# Máximo de buffers sin uso que conserva FFmpegCapture para reutilizar
+MAX_POOLED_FRAMES = 256
+
+
+class FrameSampler:
+    def __init__(self, frame_stride=1, motion_threshold=None, max_skipped_frames=10, motion_width=160,
+                 pixel_delta=25, start_index=0):
+        self.frame_stride = max(1, int(frame_stride))
+        self.motion_threshold = motion_threshold
+        self.max_skipped_frames = max_skipped_frames
+        self.motion_width = motion_width
+        self.pixel_delta = pixel_delta
+        # Índice global del primer frame, para conservar la fase del stride al procesar por segmentos
+        self._frame_index = start_index
+        self._skipped = 0
+        self._reference = None
+
+    def _downscaled_gray(self, frame):
+        height, width = frame.shape[:2]
+        motion_height = max(1, int(height * self.motion_width / width))
+        small = cv2.resize(frame, (self.motion_width, motion_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def motion_score(self, gray):
+        changed = cv2.absdiff(gray, self._reference) > self.pixel_delta
+        return np.count_nonzero(changed) / changed.size
+
+    def should_infer(self, frame):
+        index = self._frame_index
+        self._frame_index += 1
+        if index % self.frame_stride != 0:
+            return False
+        if self.motion_threshold is None:
+            return True
+
+        # Se compara contra el último frame inferido para acumular cambios lentos;
+        # max_skipped_frames evita que los objetos quietos se pierdan en el tracker
+        gray = self._downscaled_gray(frame)
+        run_inference = (self._reference is None
+                         or self._skipped >= self.max_skipped_frames
+                         or self.motion_score(gray) >= self.motion_threshold)
+        if run_inference:
+            self._reference = gray
+            self._skipped = 0
+        else:
+            self._skipped += 1
+        return run_inference
+
+
+class FrameRange:
+    def __init__(self, cap, start_frame=0, end_frame=None):
+        self.cap = cap
+        self.end_frame = end_frame
+        self.position = start_frame
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    def read(self):
+        if self.end_frame is not None and self.position >= self.end_frame:
+            return False, None
+        ret, frame = self.cap.read()
+        if ret:
+            self.position += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+    def __getattr__(self, name):
+        # frame_scale, recycle y demás atributos opcionales del capturador subyacente
+        return getattr(self.cap, name)
+
+
+def _probe_video(path, ffprobe):
+    output = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+         '-show_entries', 'stream=width,height,avg_frame_rate,nb_frames,nb_read_packets:format=duration',
+         '-of', 'json', path],
+        capture_output=True, text=True, check=True).stdout
+    info = json.loads(output)
+    stream = info['streams'][0]
+    numerator, denominator = stream.get('avg_frame_rate', '0/1').split('/')
+    fps = float(numerator) / float(denominator) if float(denominator) else 0.0
+    frames = stream.get('nb_frames') or stream.get('nb_read_packets')
+    if not frames and fps:
+        frames = float(info.get('format', {}).get('duration', 0)) * fps
+    return int(stream['width']), int(stream['height']), fps, int(float(frames or 0))
+
+
+class FFmpegCapture:
+    # Decodifica con un subproceso de FFmpeg que ya entrega los frames escalados en BGR, con la misma
+    # interfaz que cv2.VideoCapture. Los buffers devueltos con recycle() se reutilizan en lecturas siguientes.
+    def __init__(self, path, width=None, threads=0, frame_step=1, hwaccel=None, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+        self.path = path
+        self.threads = threads
+        self.frame_step = max(1, int(frame_step))
+        self.hwaccel = hwaccel
+        self.ffmpeg = shutil.which(ffmpeg)
+        self._proc = None
+        self._position = 0
+        self._pool = collections.deque()
+
+        ffprobe = shutil.which(ffprobe)
+        if self.ffmpeg is None or ffprobe is None:
+            raise RuntimeError('No se encontró ffmpeg/ffprobe en el PATH')
+        try:
+            source_width, source_height, fps, frame_count = _probe_video(path, ffprobe)
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError):
+            return
+
+        # Escala en el decodificador conservando la proporción (alto par, como exige yuv420p); nunca amplía
+        self.width = min(int(width), source_width) if width else source_width
+        self.height = int(round(source_height * self.width / source_width / 2)) * 2
+        self.frame_scale = source_width / self.width
+        # Con frame_step el video se ve como uno de menor FPS, así los tiempos siguen siendo correctos
+        self.fps = fps / self.frame_step
+        self.frame_count = frame_count // self.frame_step
+        self._frame_bytes = self.width * self.height * 3
+        self._start(0)
+
+    def _start(self, position):
+        self.release()
+        command = [self.ffmpeg, '-v', 'error', '-nostdin']
+        if self.hwaccel:
+            command += ['-hwaccel', self.hwaccel]
+        if position:
+            command += ['-ss', f'{position / self.fps:.6f}']
+        command += ['-threads', str(self.threads), '-i', self.path, '-an', '-sn']
+        filters = []
+        if self.frame_step > 1:
+            filters.append(f'select=not(mod(n\\,{self.frame_step}))')
+        if self.frame_scale != 1:
+            filters.append(f'scale={self.width}:{self.height}:flags=area')
+        if filters:
+            command += ['-vf', ','.join(filters), '-fps_mode', 'passthrough']
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+        self._proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                      bufsize=self._frame_bytes)
+        self._position = position
+
+    def isOpened(self):
+        return self._proc is not None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self._position
+        return 0.0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or self._proc is None:
+            return False
+        self._start(int(value))
+        return True
+
+    def read(self):
+        if self._proc is None:
+            return False, None
+        try:
+            frame = self._pool.popleft()
+        except IndexError:
+            frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        # Lectura directa al buffer, sin objetos bytes intermedios
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < self._frame_bytes:
+            count = self._proc.stdout.readinto(view[filled:])
+            if not count:
+                self._pool.append(frame)
+                return False, None
+            filled += count
+        self._position += 1
+        return True, frame
+
+    def recycle(self, frame):
+        if frame.shape == (self.height, self.width, 3) and len(self._pool) < MAX_POOLED_FRAMES:
+            self._pool.append(frame)
+
+    def release(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.stdout.close()
+            self._proc.wait()
+            self._proc = None
+
+
+class SteppedCapture:
+    # Con OpenCV los frames intermedios solo se demultiplexan (grab) sin convertirlos a BGR
+    def __init__(self, cap, frame_step):
+        self.cap = cap
+        self.frame_step = max(1, int(frame_step))
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        value = self.cap.get(prop)
+        if prop == cv2.CAP_PROP_FPS:
+            return value / self.frame_step
+        if prop in (cv2.CAP_PROP_FRAME_COUNT, cv2.CAP_PROP_POS_FRAMES):
+            return value // self.frame_step
+        return value
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            value *= self.frame_step
+        return self.cap.set(prop, value)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        for _ in range(self.frame_step - 1):
+            if not self.cap.grab():
+                break
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+def open_video(path, decoder='opencv', width=None, threads=0, frame_step=1, hwaccel=None):
+    if decoder not in DECODERS:
+        raise ValueError(f"Decodificador no válido: {decoder}")
+    if decoder == 'ffmpeg':
+        return FFmpegCapture(path, width=width, threads=threads, frame_step=frame_step, hwaccel=hwaccel)
+    if width:
+        raise ValueError('El escalado en el decodificador requiere decoder="ffmpeg"')
+
+    params = []
+    if threads:
+        params += [cv2.CAP_PROP_N_THREADS, int(threads)]
+    if hwaccel:
+        params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    cap = cv2.VideoCapture(path, cv2.CAP_ANY, params) if params else cv2.VideoCapture(path)
+    return SteppedCapture(cap, frame_step) if frame_step > 1 else cap
+
+
+def add_decode_arguments(parser):
+    parser.add_argument('--decoder', choices=DECODERS, default='opencv')
+    parser.add_argument('--decode-width', type=int, default=None,
+                        help='Ancho al que escala el decodificador (solo ffmpeg), p. ej. 640')
+    parser.add_argument('--decode-threads', type=int, default=0, help='Hilos de decodificación (0 = automático)')
+    parser.add_argument('--decode-step', type=int, default=1,
+                        help='Entregar uno de cada N frames desde el decodificador')
+    parser.add_argument('--hwaccel', default=None, help='Aceleración por hardware (ffmpeg: cuda, vaapi, auto...)')
+
+
+def decode_options_from_args(args):
+    return {'decoder': args.decoder, 'width': args.decode_width, 'threads': args.decode_threads,
+            'frame_step': args.decode_step, 'hwaccel': args.hwaccel}
+
+
+def read_frame_batches(cap, batch_size=1, sampler=None):
+    batch_size = max(1, int(batch_size))
+    while True:
+        batch = []
+        inferred = 0
+        while inferred < batch_size:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            run_inference = sampler.should_infer(frame) if sampler is not None else True
+            batch.append((frame, run_inference))
+            inferred += run_inference
+        if not batch:
+            return
+        yield batch
+        if inferred < batch_size:
+            return